@@ -0,0 +1,104 @@
+"""Activity index shared by the dashboard scripts.
+
+Parsed activities and their groupings are pickled into
+.activity_index.pickle next to _activities/, together with the mtime
+of every JSON file they came from. Loading the index only parses files
+that are new or changed since the last run, and the groupings and
+aggregates are rebuilt only then.
+"""
+
+from collections import defaultdict
+
+import json
+import os
+import pickle
+
+from aggregates import Aggregates
+import storage
+
+ACTIVITIES_DIR = '../_activities'
+CACHE_NAME = '.activity_index.pickle'
+CACHE_VERSION = 2
+
+def year_of(activity):
+    return int(activity['startTimeGMT'][0:4])
+
+class ActivityIndex:
+    def __init__(self, directory=ACTIVITIES_DIR):
+        self.directory = directory
+        self.cache_path = os.path.join(os.path.dirname(os.path.abspath(directory)), CACHE_NAME)
+        self.files = {}
+        self.activities = []
+        self.by_type = {}
+        self.by_year = {}
+        self.by_type_year = {}
+        self.aggregates = Aggregates([])
+        self.load()
+        self.refresh()
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'rb') as infile:
+                cache = pickle.load(infile)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if cache.get('version') == CACHE_VERSION:
+            self.__dict__.update(cache['state'])
+
+    def save(self):
+        state = {key: getattr(self, key) for key in
+                 ('files', 'activities', 'by_type', 'by_year', 'by_type_year',
+                  'aggregates')}
+        storage.write_atomic(self.cache_path, pickle.dumps(
+            {'version': CACHE_VERSION, 'state': state}, pickle.HIGHEST_PROTOCOL))
+
+    def refresh(self):
+        """Parse new or changed activity files, return True if any"""
+        seen = {}
+        changed = False
+        for entry in os.scandir(self.directory):
+            # like glob('*.json'), which skips dotfiles
+            if entry.name.startswith('.') or not entry.name.endswith('.json'):
+                continue
+            mtime = entry.stat().st_mtime
+            cached = self.files.get(entry.name)
+            if cached is not None and cached[0] == mtime:
+                seen[entry.name] = cached
+                continue
+            with open(entry.path, 'r') as activity:
+                seen[entry.name] = (mtime, json.loads(activity.read()))
+            changed = True
+
+        if not changed and len(seen) == len(self.files):
+            return False
+
+        self.files = seen
+        self.group()
+        self.save()
+        return True
+
+    def group(self):
+        self.activities = sorted((activity for _, activity in self.files.values()),
+                                 key=lambda x: x['activityId'])
+        by_type = defaultdict(list)
+        by_year = defaultdict(list)
+        by_type_year = defaultdict(list)
+        for a in self.activities:
+            typekey = a['activityType']['typeKey']
+            year = year_of(a)
+            by_type[typekey].append(a)
+            by_year[year].append(a)
+            by_type_year[(typekey, year)].append(a)
+        self.by_type = dict(by_type)
+        self.by_year = dict(by_year)
+        self.by_type_year = dict(by_type_year)
+        self.aggregates = Aggregates(self.activities)
+
+    def of_type(self, activity_type, year=None):
+        """Activities of a type, optionally in one year, oldest first"""
+        if year is None:
+            return self.by_type.get(activity_type, [])
+        return self.by_type_year.get((activity_type, year), [])
+
+    def most_recent(self, activity_type):
+        return self.by_type[activity_type][-1]
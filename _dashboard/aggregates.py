@@ -0,0 +1,71 @@
+"""Single-pass aggregates over all activities.
+
+Every activity is visited once and added to one bucket per period it
+falls in, keyed by (activity type, period, period key). Each bucket
+keeps the sum and the maximum of every field in FIELDS. Active days and
+the VO2max history are collected per period key in the same pass. New
+breakdowns are new entries in PERIODS, they don't add passes.
+"""
+
+from datetime import date
+
+FIELDS = ('distance', 'duration', 'calories', 'vO2MaxValue')
+
+# period -> function(activity) -> period key
+PERIODS = {
+    'all': lambda a: None,
+    'year': lambda a: int(a['startTimeGMT'][0:4]),
+    'month': lambda a: a['startTimeGMT'][0:7],
+    'week': lambda a: '%d-W%02d' % date.fromisoformat(a['startTimeGMT'][0:10]).isocalendar()[:2],
+}
+
+class Bucket:
+    def __init__(self):
+        self.count = 0
+        self.sums = dict.fromkeys(FIELDS, 0)
+        self.maxima = dict.fromkeys(FIELDS)
+
+    def add(self, activity):
+        self.count += 1
+        for field in FIELDS:
+            value = activity.get(field)
+            if value is None:
+                continue
+            self.sums[field] += value
+            if self.maxima[field] is None or value > self.maxima[field]:
+                self.maxima[field] = value
+
+class Aggregates:
+    def __init__(self, activities):
+        """activities must be sorted oldest first"""
+        self.buckets = {}
+        self.days = {}
+        self.vo2max = {}
+        for a in activities:
+            typekey = a['activityType']['typeKey']
+            day = a['startTimeGMT'][0:10]
+            for period, key_of in PERIODS.items():
+                key = key_of(a)
+                bucket = self.buckets.get((typekey, period, key))
+                if bucket is None:
+                    bucket = self.buckets[(typekey, period, key)] = Bucket()
+                bucket.add(a)
+                self.days.setdefault((period, key), set()).add(day)
+                if a.get('vO2MaxValue') is not None:
+                    self.vo2max.setdefault((period, key), []).append(a['vO2MaxValue'])
+
+    def bucket(self, activity_type, period='all', key=None):
+        return self.buckets.get((activity_type, period, key)) or Bucket()
+
+    def total(self, activity_type, field, period='all', key=None):
+        return self.bucket(activity_type, period, key).sums[field]
+
+    def maximum(self, activity_type, field, period='all', key=None):
+        return self.bucket(activity_type, period, key).maxima[field]
+
+    def active_days(self, period='all', key=None):
+        return len(self.days.get((period, key), ()))
+
+    def vo2max_history(self, period='all', key=None):
+        """VO2max values of all activity types, oldest first"""
+        return self.vo2max.get((period, key), [])
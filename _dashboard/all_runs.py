@@ -1,49 +1,60 @@
 #!/usr/bin/env python3
+"""The run log: one page per year of runs, newest first.
 
-from datetime import datetime
-from datetime import timedelta
-import json
+    ./all_runs.py [-o dist/runs]
+
+writes dist/runs/YYYY.html for every year with runs and the newest
+year again as dist/runs/index.html, each linking the others. Each page
+carries a stamp of its runs' files, their mtimes and tracks, and the
+year list; an older year whose page already has the current stamp isn't
+rebuilt at all, and pages are only written when they changed.
+"""
+
+from collections import defaultdict
+
+import argparse
+import hashlib
 import os
-import sys
-import glob
 import string
-from datetime import date
-from pathlib import Path
+import sys
 
-CURRENT_YEAR = date.today().year
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-activities = []
+from activity_index import ActivityIndex, year_of
+from render import write_if_changed
 
-for name in glob.glob('../_activities/*.json'):
-    with open(name, 'r') as activity:
-        obj = json.loads(activity.read())
-        activities.append(obj)
+DIST_DIR = 'dist'
+OUTPUT_DIR = 'dist/runs'
 
-def all_runs(activities):
-    ax = sorted(activities, key=lambda x: x['activityId'], reverse=True)
-    return [a for a in ax if a['activityType']['typeKey'] == 'running']
+def runs_by_year(index):
+    """{year: runs of that year, newest first}"""
+    years = sorted(year for (typekey, year) in index.by_type_year if typekey == 'running')
+    return {year: list(reversed(index.of_type('running', year))) for year in years}
 
-def svg_gpx(activity):
+def svg_gpx(activity, svg_dir, svg_url):
     distance = "%.2f" % (activity['distance'] / 1000)
-    image = Path("dist/_activities-svg/activity_%s.gpx.svg" % activity['activityId'])
-    if image.is_file():
+    name = "activity_%s.gpx.svg" % activity['activityId']
+    if os.path.isfile(os.path.join(svg_dir, name)):
         return (distance, """
-            <div class="w-full flex justify-center"><img class="h-64" src="%s"/></div>
-        """ % image)
+            <div class="w-full flex justify-center"><img class="h-64" src="%s/%s"/></div>
+        """ % (svg_url, name))
     return (distance, "")
 
 base_html = """
 <!doctype html>
+<!-- runs ${stamp} -->
 <html>
 <head>
   <meta charset="UTF-8" />
   <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-  <link href="dist/tailwind.css" rel="stylesheet">
+  <link href="${css}" rel="stylesheet">
 </head>
 <body>
 
     <h1 class="w-36 max-w-48 lg:w-48 bg-black text-white m-6 p-6 font-bold text-center">Joglog</h1>
 
+    <nav class="mx-6 text-xs">${years}</nav>
+
   ${groups}
 
   <footer class="p-6 bg-black text-gray-300 border rounded">
@@ -82,20 +93,78 @@ component_html = """
   </div>
 """
 
-base = string.Template(base_html)
-components = ''
+year_html = """<a class="${style} mr-2" href="${href}">${year}</a>"""
 
-for activity in all_runs(activities):
-    group_tpl = string.Template(group_html)
+base = string.Template(base_html)
+group_tpl = string.Template(group_html)
+component = string.Template(component_html)
+year_tpl = string.Template(year_html)
 
-    component = string.Template(component_html)
-    (distance, gpx) = svg_gpx(activity)
+def card(activity, svg_dir, svg_url):
+    (distance, gpx) = svg_gpx(activity, svg_dir, svg_url)
     calories = round(activity['calories'])
     duration = round(activity['duration'] / 60)
-    components += component.substitute(gpx=gpx,
-            distance=distance, time=duration, calories=calories)
-
-groups = group_tpl.substitute(components=components)
-render = base.substitute(groups=groups)
-
-print(render)
+    return component.substitute(gpx=gpx, distance=distance, time=duration, calories=calories)
+
+def stamps(index, years, svg_dir):
+    """{year: hash of what that year's page is built from}"""
+    files = defaultdict(list)
+    for name, (mtime, activity) in sorted(index.files.items()):
+        if activity['activityType']['typeKey'] == 'running':
+            files[year_of(activity)].append((name, mtime))
+    try:
+        tracks = set(os.listdir(svg_dir))
+    except FileNotFoundError:
+        tracks = set()
+    result = {}
+    for year, runs in years.items():
+        drawn = [run['activityId'] for run in runs
+                 if 'activity_%s.gpx.svg' % run['activityId'] in tracks]
+        result[year] = hashlib.sha1(repr((list(years), files[year], drawn)).encode()).hexdigest()
+    return result
+
+def has_stamp(path, stamp):
+    try:
+        with open(path) as infile:
+            return '<!-- runs %s -->' % stamp in infile.read()
+    except FileNotFoundError:
+        return False
+
+def render(index, output=OUTPUT_DIR, dist=DIST_DIR):
+    """{file name: html} of the pages to write, linking the tracks and
+    stylesheet in dist relative to output. Older years whose page in
+    output is up to date are left out."""
+    svg_dir = os.path.join(dist, '_activities-svg')
+    svg_url = os.path.relpath(svg_dir, output)
+    css = os.path.relpath(os.path.join(dist, 'tailwind.css'), output)
+    years = runs_by_year(index)
+    year_stamps = stamps(index, years, svg_dir)
+
+    pages = {}
+    for year, runs in years.items():
+        name = '%d.html' % year
+        if year != max(years) and has_stamp(os.path.join(output, name), year_stamps[year]):
+            continue
+        nav = ''.join(year_tpl.substitute(year=other, href='%d.html' % other,
+                                          style='font-bold' if other == year else 'underline')
+                      for other in reversed(list(years)))
+        components = ''.join(card(activity, svg_dir, svg_url) for activity in runs)
+        groups = group_tpl.substitute(components=components)
+        pages[name] = base.substitute(stamp=year_stamps[year], css=css, years=nav, groups=groups)
+    if years:
+        pages['index.html'] = pages['%d.html' % max(years)]
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the run log')
+    parser.add_argument('-o', metavar='DIR', default=OUTPUT_DIR,
+            help='output directory (default: %s)' % OUTPUT_DIR)
+    args = parser.parse_args()
+
+    pages = render(ActivityIndex(), args.o)
+    for name, html in pages.items():
+        if write_if_changed(os.path.join(args.o, name), html):
+            print(name)
+
+if __name__ == '__main__':
+    main()
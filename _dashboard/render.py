@@ -0,0 +1,69 @@
+"""Fragment cache and page output shared by the dashboard scripts.
+
+Fragments.get() keys the output of an expensive builder, like the HR and
+VO2max charts, by a hash of its inputs and only calls the builder for
+inputs it hasn't seen, so an hourly render redraws just the charts whose
+data changed. Each page keeps its own cache in
+_dashboard/.<page>.fragments, holding the fragments its last render used,
+so it doesn't grow past one page's worth.
+
+write_if_changed() leaves a file alone when its content is the same,
+keeping its mtime, so `cp -Ru dist` only copies what changed.
+"""
+
+import hashlib
+import os
+import pickle
+
+import storage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_VERSION = 1
+
+def write_if_changed(path, text):
+    """Write text to path unless it already holds it, return True if written"""
+    data = text.encode()
+    try:
+        with open(path, 'rb') as infile:
+            if infile.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    storage.write_atomic(path, data)
+    return True
+
+class Fragments:
+    def __init__(self, page, directory=HERE):
+        self.path = os.path.join(directory, '.%s.fragments' % page)
+        self.cached = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.path, 'rb') as infile:
+                cache = pickle.load(infile)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if cache.get('version') == CACHE_VERSION:
+            self.cached = cache['fragments']
+
+    def get(self, kind, inputs, build):
+        """The fragment for inputs, calling build() if it isn't cached.
+        inputs must have a stable repr: strings, numbers, tuples, dicts."""
+        key = hashlib.sha1(repr((kind, inputs)).encode()).hexdigest()
+        html = self.used.get(key, self.cached.get(key))
+        if html is None:
+            html = build()
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.used[key] = html
+        return html
+
+    def save(self):
+        """Keep the fragments this render used, drop the rest"""
+        if self.used != self.cached:
+            storage.write_atomic(self.path, pickle.dumps(
+                {'version': CACHE_VERSION, 'fragments': self.used}, pickle.HIGHEST_PROTOCOL))
+        self.cached, self.used = self.used, {}
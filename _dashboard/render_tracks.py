@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Render activity GPX tracks to SVG in one process.
+
+Uses gpx2svg's functions directly instead of starting it once per file.
+A track is skipped when its SVG is newer than the GPX, or when the GPX
+content hash matches the one recorded the last time it was rendered with
+the same settings. The hashes are kept in _dashboard/.tracks.hashes.json,
+outside dist/ which is published as is.
+Remaining tracks are rendered in parallel, one per core.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from importlib.machinery import SourceFileLoader
+
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import instrument
+import storage
+
+def load_gpx2svg():
+    loader = SourceFileLoader('gpx2svg', os.path.join(HERE, 'gpx2svg'))
+    spec = importlib.util.spec_from_loader('gpx2svg', loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+gpx2svg = load_gpx2svg()
+
+MANIFEST = os.path.join(HERE, '.tracks.hashes.json')
+
+def file_hash(path):
+    with open(path, 'rb') as infile:
+        return hashlib.sha1(infile.read()).hexdigest()
+
+def render(gpx, svg, max_pixels, tolerance=None, digits=None):
+    """Same steps as running `gpx2svg -i gpx -o svg -m max_pixels -t tolerance -P digits`.
+    Returns False when the track has no points to draw."""
+    with instrument.span('render_tracks.render', gpx=os.path.basename(gpx)) as span:
+        # seconds spent in each gpx2svg stage
+        started = time.perf_counter()
+        try:
+            gpsData = gpx2svg.parseGpxStream(gpx)
+        except SystemExit:
+            return False
+        if gpsData == []:
+            return False
+        span['parse'] = round(time.perf_counter() - started, 6)
+        span['points'] = sum(len(segment) for segment in gpsData)
+
+        started = time.perf_counter()
+        gpsData = gpx2svg.combineSegments(gpsData)
+        span['combine'] = round(time.perf_counter() - started, 6)
+
+        started = time.perf_counter()
+        gpsData = gpx2svg.calcProjection(gpsData, gpx2svg.Projection.Mercator)
+        gpsData, width, height = gpx2svg.moveProjectedData(gpsData)
+        span['project'] = round(time.perf_counter() - started, 6)
+
+        started = time.perf_counter()
+        cmdArgs = argparse.Namespace(m=max_pixels, d=False, o=svg + '.part', s=None,
+                                     t=tolerance, P=digits)
+        gpx2svg.writeSvgData(gpsData, width, height, cmdArgs)
+        os.replace(svg + '.part', svg)
+        span['write'] = round(time.perf_counter() - started, 6)
+        span['bytes'] = os.path.getsize(svg)
+    return True
+
+def render_job(job):
+    gpx, svg, max_pixels, tolerance, digits, digest = job
+    return os.path.basename(gpx), digest, render(gpx, svg, max_pixels, tolerance, digits)
+
+def render_all(src, dest, max_pixels=400, tolerance=0.5, digits=1, workers=None,
+               manifest_path=MANIFEST):
+    """Render the GPX files in src that changed since the last run into
+    dest, return the names of the GPX files rendered"""
+    # bundle storage only downloads the ORIGINAL zip
+    storage.derive_gpx(src)
+    os.makedirs(dest, exist_ok=True)
+    try:
+        with open(manifest_path) as infile:
+            manifest = json.load(infile)
+    except (OSError, ValueError):
+        manifest = {}
+
+    # SVGs rendered with other settings or elsewhere are all out of date
+    options = [max_pixels, tolerance, digits, os.path.abspath(dest)]
+    if manifest.get('options') != options:
+        manifest = {'options': options, 'tracks': {}}
+    tracks = manifest['tracks']
+
+    jobs = []
+    for gpx in sorted(glob.glob(os.path.join(src, '*.gpx'))):
+        name = os.path.basename(gpx)
+        svg = os.path.join(dest, name + '.svg')
+        gpx_mtime = os.stat(gpx).st_mtime
+        try:
+            if name in tracks and os.stat(svg).st_mtime >= gpx_mtime:
+                continue
+        except FileNotFoundError:
+            pass
+
+        digest = file_hash(gpx)
+        entry = tracks.get(name)
+        if entry and entry['hash'] == digest and (not entry['svg'] or os.path.exists(svg)):
+            if entry['svg']:
+                # touched but unchanged, bring the SVG up to date
+                os.utime(svg)
+            continue
+        jobs.append((gpx, svg, max_pixels, tolerance, digits, digest))
+
+    if not jobs:
+        return []
+
+    done = []
+    # the scheduler calls this from a worker thread while other jobs run,
+    # and forking a threaded process can leave a child stuck on a lock.
+    # Workers don't inherit instrument.configure(), so pass the path on.
+    context = multiprocessing.get_context('forkserver')
+    with instrument.span('render_tracks.render_all', tracks=len(jobs)) as span, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=instrument.configure,
+                                initargs=(instrument.metrics.path,)) as pool:
+        for name, digest, rendered in pool.map(render_job, jobs):
+            tracks[name] = {'hash': digest, 'svg': rendered}
+            if rendered:
+                done.append(name)
+            else:
+                print('No track data in %s' % name, file=sys.stderr)
+        span['rendered'] = len(done)
+
+    storage.write_atomic(manifest_path, json.dumps(manifest, sort_keys=True, indent=4).encode())
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-i', metavar='DIR', default='../_activities',
+            help='directory with activity_*.gpx files (default: ../_activities)')
+    parser.add_argument('-o', metavar='DIR', default='dist/_activities-svg',
+            help='output directory (default: dist/_activities-svg)')
+    parser.add_argument('-m', metavar='PIXELS', type=int, default=400,
+            help='maximum width or height of the SVG output in pixels (default: 400)')
+    parser.add_argument('-t', metavar='PIXELS', type=float, default=0.5,
+            help='drop points closer than PIXELS to the simplified path (default: 0.5)')
+    parser.add_argument('-P', metavar='DIGITS', type=int, default=1,
+            help='decimal places kept in SVG coordinates (default: 1)')
+    parser.add_argument('-j', metavar='N', type=int, default=os.cpu_count(),
+            help='parallel renders (default: number of cores)')
+    args = parser.parse_args()
+
+    rendered = render_all(args.i, args.o, args.m, args.t, args.P, args.j)
+    print('Rendered %d tracks' % len(rendered))
+
+if __name__ == '__main__':
+    main()
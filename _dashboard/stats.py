@@ -3,6 +3,7 @@
 from datetime import datetime
 import dateutil.parser as dparser
 from datetime import timedelta
+from datetime import timezone
 import json
 import os
 import sys
@@ -10,32 +11,41 @@ import glob
 import string
 from datetime import date
 
+import argparse
+import hashlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from activity_index import ActivityIndex
+from hrstore import HeartStore, downsample
+from render import Fragments, write_if_changed
+import instrument
+
 CURRENT_YEAR = date.today().year
 
-activities = []
+# the HR polyline is 400 wide with a point every 2
+HR_POINTS = 200
 
-for name in glob.glob('../_activities/*.json'):
-    with open(name, 'r') as activity:
-        obj = json.loads(activity.read())
-        activities.append(obj)
+# set by render()
+heart = None
+index = None
+aggregates = None
+fragments = None
 
-def maximum(activities, activity_type, field):
-    return max(a[field] for a in activities if a['activityType']['typeKey'] == activity_type and a[field] is not None)
+def maximum(activity_type, field):
+    return aggregates.maximum(activity_type, field)
 
-def summary(activities, activity_type, field):
-    return sum(a[field] for a in activities if a['activityType']['typeKey'] == activity_type)
+def summary(activity_type, field):
+    return aggregates.total(activity_type, field)
 
-def summary_this_year(activities, activity_type, field):
-    this_year = [a for a in activities if a['startTimeGMT'].startswith('%d' %
-        CURRENT_YEAR)]
-    return summary(this_year, activity_type, field)
+def summary_this_year(activity_type, field):
+    return aggregates.total(activity_type, field, 'year', CURRENT_YEAR)
 
-def distinct_active_days(activities):
-    return len(set([a['startTimeGMT'][0:10] for a in activities if a['startTimeGMT'].startswith('%d' % CURRENT_YEAR)]))
+def distinct_active_days():
+    return aggregates.active_days('year', CURRENT_YEAR)
 
-def most_recent(activities, activity_type):
-    return [a for a in sorted(activities, key=lambda x: x['activityId']) if a['activityType']['typeKey'] ==
-            activity_type][-1]
+def most_recent(activity_type):
+    return index.most_recent(activity_type)
 
 def svg_gpx(activity):
     distance = activity['distance'] / 1000
@@ -44,10 +54,10 @@ def svg_gpx(activity):
     <img class="w-3/4" src="dist/_activities-svg/activity_%s.gpx.svg"/>
     """ % (distance, activity['activityId'])
 
-def vo2_max_widget(activities):
-    max_vo2_max = str(maximum(activities, 'running', 'vO2MaxValue'))
-    current = str(most_recent(activities, 'running')['vO2MaxValue'])
-    svg = svg_vo2max(activities)
+def vo2_max_widget():
+    max_vo2_max = str(maximum('running', 'vO2MaxValue'))
+    current = str(most_recent('running')['vO2MaxValue'])
+    svg = svg_vo2max()
     html = """
     <span class="text-xs w-full">
     <span class="text-gray-500 font-normal mr-2">Peak:&nbsp;<span class="text-black font-bold">%s</span></span>
@@ -58,14 +68,16 @@ def vo2_max_widget(activities):
     return html
 
 
-def svg_vo2max(activities):
+def svg_vo2max():
+    values = tuple(aggregates.vo2max_history('year', CURRENT_YEAR))
+    return fragments.get('svg_vo2max', values, lambda: draw_vo2max(values))
+
+def draw_vo2max(values):
     history = []
     ts = 0
-    values = [a['vO2MaxValue'] for a in sorted(activities, key=lambda x: x['activityId']) if a['startTimeGMT'].startswith('%d' % CURRENT_YEAR)]
     for value in values:
-        if value is not None:
-            history.append(','.join([str(ts), str(200 - (value * 4))]))
-            ts += 1
+        history.append(','.join([str(ts), str(200 - (value * 4))]))
+        ts += 1
 
     svg = """
     <svg class="w-full" viewBox="0 0 200 50">
@@ -76,31 +88,29 @@ def svg_vo2max(activities):
 
 
 def svg_hr(activity):
-    activity_start_date = dparser.parse(activity['startTimeGMT'])
-    heart_ts_start = int((activity_start_date - timedelta(seconds=60) + timedelta(hours=1)).timestamp()) * 1000
-    heart_ts_end = int(heart_ts_start + (activity['duration']*1000) + (3600 * 3
-        * 1000))
-
-    ts = activity['startTimeGMT'][0:10]
-
-    workout_width = 100
-    workout_x = 0
-
-    with open("../%s/heart.dat" % ts) as json_file:
-        data = json.load(json_file)
-        beats = []
-        ts = 0
-        for row in data['heartRateValues']:
-            if workout_x == 0 and row[0] >= (heart_ts_start + 3600000):
-                workout_x = ts
-                workout_width = int((activity['duration']+240)/60)
-
-            if int(row[0]) >= heart_ts_start and int(row[0]) <= heart_ts_end:
-                ts += 2
+    """Heart rate from a minute before the activity until three hours after
+    its planned end, which may run past midnight"""
+    activity_start_date = dparser.parse(activity['startTimeGMT']).replace(tzinfo=timezone.utc)
+    heart_ts_start = int(activity_start_date.timestamp()) - 60
+    heart_ts_end = heart_ts_start + int(activity['duration']) + 3600 * 3
+
+    with instrument.span('stats.hr_window', activity=activity['activityId']) as span:
+        timestamps, rates = heart.window(heart_ts_start, heart_ts_end + 1)
+        span['samples'] = len(rates)
+
+    # the samples themselves are the input: today's activity keeps
+    # gaining readings for three hours after it ends
+    inputs = (heart_ts_start, heart_ts_end, hashlib.sha1(rates).hexdigest())
+    return fragments.get('svg_hr', inputs, lambda: draw_hr(rates))
+
+def draw_hr(rates):
+    beats = []
+    ts = 0
+    for bpm in downsample(rates, HR_POINTS):
+        ts += 2
 
-                bpm = row[1] or 200
-                pm = 200 - bpm
-                beats.append(','.join([str(ts), str(pm)]))
+        pm = 200 - (bpm or 200)
+        beats.append(','.join([str(ts), str(pm)]))
 
     svg = """
     <svg class="w-full" viewBox="0 0 400 200">
@@ -110,91 +120,6 @@ def svg_hr(activity):
 
     return svg
 
-distance_running = summary(activities, 'running', 'distance') / 1000
-distance_walking = summary(activities, 'walking', 'distance') / 1000
-distance_cycling = summary(activities, 'cycling', 'distance') / 1000
-
-distance_running_this_year = summary_this_year(activities, 'running', 'distance') / 1000
-distance_walking_this_year = summary_this_year(activities, 'walking', 'distance') / 1000
-distance_cycling_this_year = summary_this_year(activities, 'cycling', 'distance') / 1000
-
-duration_running = summary(activities, 'running', 'duration') / 3600
-duration_walking = summary(activities, 'walking', 'duration') / 3600
-duration_cycling = summary(activities, 'cycling', 'duration') / 3600
-duration_strength = summary(activities, 'indoor_cardio', 'duration') / 3600
-
-duration_running_this_year = summary_this_year(activities, 'running', 'duration') / 3600
-duration_walking_this_year = summary_this_year(activities, 'walking', 'duration') / 3600
-duration_cycling_this_year = summary_this_year(activities, 'cycling', 'duration') / 3600
-duration_strength_this_year = summary_this_year(activities, 'indoor_cardio', 'duration') / 3600
-
-duration_all_this_year = duration_running_this_year + duration_walking_this_year + duration_cycling_this_year + duration_strength_this_year 
-
-distance_all_this_year = distance_walking_this_year + distance_cycling_this_year + distance_running_this_year
-
-duration_all = duration_running + duration_walking + duration_cycling + duration_strength 
-
-distance_all = distance_walking + distance_cycling + distance_running
-
-active_days = distinct_active_days(activities)
-d0 = date(CURRENT_YEAR, 1, 1)
-d1 = date.today()
-days_this_year = (d1 - d0).days + 1
-percentage_active_days = (active_days * 100) / days_this_year
-
-component_groups = [
-        {'name': 'activities', 'components': [
-            {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % distance_all_this_year},
-            {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % duration_all_this_year},
-            {'label': 'Distance (total)', 'value': '%.2f km' % distance_all},
-            {'label': 'Duration (total)', 'value': '%d h' % duration_all},
-            {'label': 'Active days (%d)' % CURRENT_YEAR, 'value': '%d/%d (%d%%)' %
-                (active_days, days_this_year, percentage_active_days)},
-            {'label': 'VO2Max (%d)' % CURRENT_YEAR, 'value': vo2_max_widget(activities)}
-            ]},
-        {'name': 'running', 'components': [
-        {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % (distance_running_this_year )},
-        {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_running_this_year)},
-        {'label': 'Distance (total)', 'value': '%.2f km' % (distance_running)},
-        {'label': 'Duration (total)', 'value': '%d h' % (duration_running)},
-        {'label': 'Last run HR', 'value': svg_hr(most_recent(activities,
-            'running'))},
-        {'label': 'Last track', 'value': svg_gpx(most_recent(activities,
-            'running'))},
-        {'label': 'Longest run', 'value': '%.2f km' % (maximum(activities, 'running', 'distance') / 1000.00)}
-
-        ]},
-
-        {'name': 'strength', 'components': [
-        {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_strength_this_year)},
-        {'label': 'Duration (total)', 'value': '%d h' % (duration_strength)},
-        {'label': 'Last workout HR', 'value': svg_hr(most_recent(activities,
-            'indoor_cardio'))},
-        ]},
-
-        {'name': 'cycling', 'components': [
-        {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % (distance_cycling_this_year )},
-        {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_cycling_this_year)},
-        {'label': 'Distance (total)', 'value': '%.2f km' % (distance_cycling)},
-        {'label': 'Duration (total)', 'value': '%d h' % (duration_cycling)},
-        {'label': 'Last cycle HR', 'value': svg_hr(most_recent(activities,
-            'cycling'))},
-        {'label': 'Last track', 'value': svg_gpx(most_recent(activities,
-            'cycling'))}
-        ]},
-
-        {'name': 'walking', 'components': [
-        {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % (distance_walking_this_year )},
-        {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_walking_this_year)},
-        {'label': 'Distance (total)', 'value': '%.2f km' % (distance_walking)},
-        {'label': 'Duration (total)', 'value': '%d h' % (duration_walking)},
-        {'label': 'Last walk HR', 'value': svg_hr(most_recent(activities,
-            'walking'))},
-        {'label': 'Last track', 'value': svg_gpx(most_recent(activities,
-            'walking'))}
-        ]},
-]
-
 base_html = """
 <!doctype html>
 <html>
@@ -252,19 +177,126 @@ component_html = """
 """
 
 base = string.Template(base_html)
+group_tpl = string.Template(group_html)
+component = string.Template(component_html)
+
+def render(activity_index, heart_store, page_fragments=None):
+    """The dashboard page for an ActivityIndex and an updated HeartStore.
+    The HR and VO2max charts come from page_fragments, by default the
+    cache in _dashboard/.stats.fragments, and are only redrawn when their
+    inputs change."""
+    global CURRENT_YEAR, index, heart, aggregates, fragments
+    CURRENT_YEAR = date.today().year
+    index, heart, aggregates = activity_index, heart_store, activity_index.aggregates
+    fragments = page_fragments or Fragments('stats')
+
+    distance_running = summary('running', 'distance') / 1000
+    distance_walking = summary('walking', 'distance') / 1000
+    distance_cycling = summary('cycling', 'distance') / 1000
+
+    distance_running_this_year = summary_this_year('running', 'distance') / 1000
+    distance_walking_this_year = summary_this_year('walking', 'distance') / 1000
+    distance_cycling_this_year = summary_this_year('cycling', 'distance') / 1000
+
+    duration_running = summary('running', 'duration') / 3600
+    duration_walking = summary('walking', 'duration') / 3600
+    duration_cycling = summary('cycling', 'duration') / 3600
+    duration_strength = summary('indoor_cardio', 'duration') / 3600
+
+    duration_running_this_year = summary_this_year('running', 'duration') / 3600
+    duration_walking_this_year = summary_this_year('walking', 'duration') / 3600
+    duration_cycling_this_year = summary_this_year('cycling', 'duration') / 3600
+    duration_strength_this_year = summary_this_year('indoor_cardio', 'duration') / 3600
+
+    duration_all_this_year = duration_running_this_year + duration_walking_this_year + duration_cycling_this_year + duration_strength_this_year 
+
+    distance_all_this_year = distance_walking_this_year + distance_cycling_this_year + distance_running_this_year
+
+    duration_all = duration_running + duration_walking + duration_cycling + duration_strength 
+
+    distance_all = distance_walking + distance_cycling + distance_running
+
+    active_days = distinct_active_days()
+    d0 = date(CURRENT_YEAR, 1, 1)
+    d1 = date.today()
+    days_this_year = (d1 - d0).days + 1
+    percentage_active_days = (active_days * 100) / days_this_year
+
+    component_groups = [
+            {'name': 'activities', 'components': [
+                {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % distance_all_this_year},
+                {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % duration_all_this_year},
+                {'label': 'Distance (total)', 'value': '%.2f km' % distance_all},
+                {'label': 'Duration (total)', 'value': '%d h' % duration_all},
+                {'label': 'Active days (%d)' % CURRENT_YEAR, 'value': '%d/%d (%d%%)' %
+                    (active_days, days_this_year, percentage_active_days)},
+                {'label': 'VO2Max (%d)' % CURRENT_YEAR, 'value': vo2_max_widget()}
+                ]},
+            {'name': 'running', 'components': [
+            {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % (distance_running_this_year )},
+            {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_running_this_year)},
+            {'label': 'Distance (total)', 'value': '%.2f km' % (distance_running)},
+            {'label': 'Duration (total)', 'value': '%d h' % (duration_running)},
+            {'label': 'Last run HR', 'value': svg_hr(most_recent('running'))},
+            {'label': 'Last track', 'value': svg_gpx(most_recent('running'))},
+            {'label': 'Longest run', 'value': '%.2f km' % (maximum('running', 'distance') / 1000.00)}
 
+            ]},
+
+            {'name': 'strength', 'components': [
+            {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_strength_this_year)},
+            {'label': 'Duration (total)', 'value': '%d h' % (duration_strength)},
+            {'label': 'Last workout HR', 'value': svg_hr(most_recent('indoor_cardio'))},
+            ]},
 
-groups = ''
-for group in component_groups:
-    components = ''
-    group_tpl = string.Template(group_html)
+            {'name': 'cycling', 'components': [
+            {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % (distance_cycling_this_year )},
+            {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_cycling_this_year)},
+            {'label': 'Distance (total)', 'value': '%.2f km' % (distance_cycling)},
+            {'label': 'Duration (total)', 'value': '%d h' % (duration_cycling)},
+            {'label': 'Last cycle HR', 'value': svg_hr(most_recent('cycling'))},
+            {'label': 'Last track', 'value': svg_gpx(most_recent('cycling'))}
+            ]},
 
-    for data in group['components']:
-        component = string.Template(component_html)
-        components += component.substitute(data)
+            {'name': 'walking', 'components': [
+            {'label': 'Distance (%d)' % CURRENT_YEAR, 'value': '%.2f km' % (distance_walking_this_year )},
+            {'label': 'Duration (%d)' % CURRENT_YEAR, 'value': '%d h' % (duration_walking_this_year)},
+            {'label': 'Distance (total)', 'value': '%.2f km' % (distance_walking)},
+            {'label': 'Duration (total)', 'value': '%d h' % (duration_walking)},
+            {'label': 'Last walk HR', 'value': svg_hr(most_recent('walking'))},
+            {'label': 'Last track', 'value': svg_gpx(most_recent('walking'))}
+            ]},
+    ]
 
-    groups += group_tpl.substitute(components=components, caption=group['name'])
+    groups = []
+    for group in component_groups:
+        components = ''.join(component.substitute(data) for data in group['components'])
+        groups.append(group_tpl.substitute(components=components, caption=group['name']))
 
-render = base.substitute(groups=groups)
+    html = base.substitute(groups=''.join(groups))
+    fragments.save()
+    return html
 
-print(render)
+def main():
+    parser = argparse.ArgumentParser(description='Render the dashboard page')
+    parser.add_argument('-o', metavar='FILE',
+            help='write the page to FILE, only if it changed (default: stdout)')
+    args = parser.parse_args()
+
+    store = HeartStore('..')
+    with instrument.span('stats.heart_update') as span:
+        span['months'] = len(store.update())
+    with instrument.span('stats.index') as span:
+        activity_index = ActivityIndex()
+        span['activities'] = len(activity_index.activities)
+    with instrument.span('stats.render') as span:
+        html = render(activity_index, store)
+        span['bytes'] = len(html)
+    if args.o:
+        # the same bytes `stats.py > FILE` writes
+        write_if_changed(args.o, html + '\n')
+    else:
+        print(html)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Total running distance and the SVG badge showing it.
+
+The distance of every activity JSON already counted is kept in
+.badge_cache.json next to _activities/, keyed by file name (non-running
+activities count as 0), together with the running total. It stays out
+of _activities/ so only activity files live there. A run lists the directory
+and only opens files that aren't in the cache yet.
+
+    ./badge.py BADGE.svg      # write the badge
+    ./badge.py                # print the distance in km
+"""
+
+from string import Template
+
+import json
+import math
+import os
+import sys
+
+import storage
+
+ACTIVITIES_DIR = '_activities'
+CACHE_NAME = '.badge_cache.json'
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'badge.svg.tmpl')
+
+def running_distance(activity):
+    if activity['activityType']['typeKey'] != 'running':
+        return 0
+    return activity.get('distance') or 0
+
+def load_cache(path):
+    try:
+        with open(path) as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return {'distances': {}, 'total': 0}
+
+def save_cache(path, cache):
+    storage.write_atomic(path, json.dumps(cache).encode())
+
+def cache_path_for(directory):
+    return os.path.join(os.path.dirname(os.path.abspath(directory)), CACHE_NAME)
+
+def total_distance(directory=ACTIVITIES_DIR):
+    """Total running distance in metres"""
+    cache_path = cache_path_for(directory)
+    cache = load_cache(cache_path)
+    distances = cache['distances']
+    names = set(name for name in os.listdir(directory)
+                if name.startswith('activity_') and name.endswith('.json'))
+
+    new = names.difference(distances)
+    gone = set(distances).difference(names)
+    if not new and not gone:
+        return cache['total']
+
+    for name in gone:
+        del distances[name]
+    for name in new:
+        with open(os.path.join(directory, name)) as infile:
+            distances[name] = running_distance(json.load(infile))
+    if gone:
+        cache['total'] = math.fsum(distances.values())
+    else:
+        cache['total'] += math.fsum(distances[name] for name in new)
+    save_cache(cache_path, cache)
+    return cache['total']
+
+def write_badge(path, distance):
+    with open(TEMPLATE) as infile:
+        svg = Template(infile.read()).substitute(DISTANCE=int(distance // 1000))
+    storage.write_atomic(path, svg.encode())
+
+def main():
+    distance = total_distance()
+    if len(sys.argv) > 1:
+        write_badge(sys.argv[1], distance)
+    else:
+        print(int(distance // 1000))
+
+if __name__ == '__main__':
+    main()
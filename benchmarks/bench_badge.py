@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""badge.py against the old cat | jq | jq | bc pipeline.
+
+Writes synthetic activity JSONs, then times the shell pipeline, a cold
+badge.py run (no cache), a warm one (nothing new) and one after a few
+new activities land. bc is left out when it isn't installed, the
+division is done here instead.
+
+    benchmarks/bench_badge.py --activities 5000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import badge
+from fake_garmin import FakeGarmin
+
+PIPELINE = ('cat _activities/*.json | jq -c \'. | select(.activityType.typeKey == "running")\''
+            ' | jq -n \'[inputs | .distance] | add\'')
+
+def write_activities(directory, activities, first=0):
+    client = FakeGarmin(None, None, activities=first + activities)
+    for activity in client.get_activities(0, activities):
+        path = os.path.join(directory, 'activity_%s.json' % activity['activityId'])
+        with open(path, 'w') as outfile:
+            json.dump(activity, outfile, sort_keys=True, indent=4)
+
+def shell_distance(root):
+    if shutil.which('bc'):
+        out = subprocess.run('echo "$(%s) / 1000" | bc' % PIPELINE, shell=True, cwd=root,
+                             check=True, capture_output=True, text=True).stdout
+        return int(out)
+    out = subprocess.run(PIPELINE, shell=True, cwd=root,
+                         check=True, capture_output=True, text=True).stdout
+    return int(float(out) // 1000)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--activities', type=int, default=5000)
+    parser.add_argument('--new', type=int, default=5,
+            help='activities added before the incremental run (default: 5)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        directory = os.path.join(root, '_activities')
+        os.makedirs(directory)
+        write_activities(directory, args.activities)
+
+        expected, shell = timed(shell_distance, root)
+        print('shell pipeline   %8.3fs  %d km' % (shell, expected))
+        for label in ('cold', 'warm'):
+            distance, seconds = timed(badge.total_distance, directory)
+            assert int(distance // 1000) == expected, (distance, expected)
+            print('badge.py %-7s %8.3fs  %d km' % (label, seconds, distance // 1000))
+
+        write_activities(directory, args.new, first=args.activities)
+        expected = shell_distance(root)
+        distance, seconds = timed(badge.total_distance, directory)
+        assert int(distance // 1000) == expected, (distance, expected)
+        print('badge.py +%-6d %8.3fs  %d km' % (args.new, seconds, distance // 1000))
+
+if __name__ == '__main__':
+    main()
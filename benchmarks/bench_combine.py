@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""gpx2svg.combineSegments against the original linear-scan version.
+
+Builds tracks cut into hundreds of fragments that share their end
+points, shuffles them, checks both versions give the same segments and
+times them.
+
+    benchmarks/bench_combine.py --segments 200 500 1000
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_dashboard'))
+
+from render_tracks import gpx2svg
+
+def legacy_combineSegmentPairs(gpsData):
+    combinedData = []
+    while len(gpsData) > 0:
+        firstTrackData = gpsData.pop()
+        foundMatch = False
+        for i in range(len(gpsData)):
+            if firstTrackData[len(firstTrackData) - 1] == gpsData[i][0]:
+                foundMatch = True
+                break
+        if foundMatch == True:
+            firstTrackData.pop()
+            combinedData.append(firstTrackData + gpsData[i])
+            gpsData.pop(i)
+        else:
+            combinedData.append(firstTrackData)
+    return gpx2svg.searchCircularSegments(combinedData)
+
+def legacy_combineSegments(gpsData):
+    circularSegments, remainingSegments = gpx2svg.searchCircularSegments(gpsData)
+    while True:
+        segmentsBefore = len(remainingSegments)
+        newCircularSegments, remainingSegments = legacy_combineSegmentPairs(remainingSegments)
+        circularSegments = circularSegments + newCircularSegments
+        if segmentsBefore == len(remainingSegments):
+            break
+    return circularSegments + remainingSegments
+
+def fragmented(segments, rng, points=20):
+    """A few tracks (one of them a loop) cut into `segments` fragments, in
+    random order, with some duplicate start points thrown in"""
+    data = []
+    for track in range(4):
+        count = segments // 4
+        track_points = [(track + rng.random(), rng.random()) for _ in range(count * points + 1)]
+        if track == 0:
+            track_points[-1] = track_points[0]
+        for n in range(count):
+            data.append(track_points[n * points:(n + 1) * points + 1])
+    for _ in range(segments // 20):
+        fragment = rng.choice(data)
+        data.append([fragment[0], (rng.random(), rng.random())])
+    rng.shuffle(data)
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--segments', type=int, nargs='+', default=[200, 500, 1000, 2000, 5000])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for segments in args.segments:
+        data = fragmented(segments, rng)
+
+        legacy_input = copy.deepcopy(data)
+        started = time.perf_counter()
+        expected = legacy_combineSegments(legacy_input)
+        legacy = time.perf_counter() - started
+
+        indexed_input = copy.deepcopy(data)
+        started = time.perf_counter()
+        result = gpx2svg.combineSegments(indexed_input)
+        indexed = time.perf_counter() - started
+
+        assert result == expected, 'combineSegments differs for %d segments' % segments
+        print('%5d segments -> %4d paths  legacy %7.3fs  indexed %7.3fs'
+              % (len(data), len(result), legacy, indexed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""gpx2svg's streaming GPX parser against the minidom one.
+
+    benchmarks/bench_gpx.py --points 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_dashboard'))
+
+from render_tracks import gpx2svg
+from synth import write_gpx
+
+def measure(parse, path):
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = parse(path)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return data, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'synthetic.gpx')
+        write_gpx(path, args.points)
+        print('%d points, %.1f MB GPX' % (args.points, os.path.getsize(path) / 1e6))
+
+        dom, dom_time, dom_peak = measure(gpx2svg.parseGpx, path)
+        stream, stream_time, stream_peak = measure(gpx2svg.parseGpxStream, path)
+        assert dom == stream, 'parsers disagree'
+
+        print('minidom   %6.2fs  peak %7.1f MB' % (dom_time, dom_peak / 1e6))
+        print('streaming %6.2fs  peak %7.1f MB' % (stream_time, stream_peak / 1e6))
+
+if __name__ == '__main__':
+    main()
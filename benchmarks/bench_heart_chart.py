@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""scripts/heart_chart.py drawing time against the number of samples.
+
+Feeds 48 hours of synthetic readings at increasing sample rates through
+the min/max column decimation and the PNG encoder. Drawing should stay
+flat, only the decimation pass grows with the samples.
+
+    benchmarks/bench_heart_chart.py --scales 1 10 100
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import heart_chart
+
+def samples(count, start=1604188800, hours=48):
+    step = hours * 3600 / count
+    timestamps = [start + int(n * step) for n in range(count)]
+    rates = [0 if n % 97 == 0 else 60 + int(40 * (1 + math.sin(n / 50))) for n in range(count)]
+    return timestamps, rates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+            help='multiples of one reading every 2 minutes (default: 1 10 100)')
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        timestamps, rates = samples(1440 * scale)
+        start = time.perf_counter()
+        chart = heart_chart.Chart(timestamps, rates, 1920, 1080)
+        decimated = time.perf_counter()
+        chart.png()
+        drawn = time.perf_counter()
+        print('%4dx %8d samples  decimate %6.3fs  draw %6.3fs'
+              % (scale, len(timestamps), decimated - start, drawn - decimated))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Throughput of process.py's JSON rebuild with 1 and N workers.
+
+    benchmarks/bench_process.py --days 365 --jobs 8
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import process
+import synth
+
+def run(workers):
+    started = time.perf_counter()
+    process.dump_json(workers)
+    elapsed = time.perf_counter() - started
+    samples = 0
+    for f in glob.glob('sqlite-input/*.json'):
+        with open(f) as infile:
+            samples += len(json.load(infile))
+    return elapsed, samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        os.chdir(root)
+        synth.write_days(root, args.days)
+        os.makedirs('sqlite-input')
+        # the JSON rebuild only reads 2020-* steps, sleep and heart files
+        files = sum(len(glob.glob('2020-*/%s.dat' % kind)) for kind in ('steps', 'sleep', 'heart'))
+
+        for workers in sorted(set([1, args.jobs])):
+            elapsed, samples = run(workers)
+            print('workers=%-3d %6.2fs %8.0f files/s %10.0f samples/s'
+                  % (workers, elapsed, files / elapsed, samples / elapsed))
+
+if __name__ == '__main__':
+    main()
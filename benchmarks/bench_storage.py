@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Size and read time of day files against day bundles.
+
+Writes synthetic days as .dat files, measures them, packs them into
+bundles with storage.pack() and measures again.
+
+    benchmarks/bench_storage.py --days 365
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import storage
+import synth
+
+def measure(root):
+    days = sorted(glob.glob(os.path.join(root, storage.DAY_DIRS)))
+    size = sum(os.path.getsize(path) for day in days for path in storage.day_paths(day))
+    started = time.perf_counter()
+    for day in days:
+        storage.read_day(day)
+    return size, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        synth.write_days(root, args.days)
+        size, elapsed = measure(root)
+        print('files   %8.1f MB  read %6.2fs' % (size / 1e6, elapsed))
+
+        for day in glob.glob(os.path.join(root, storage.DAY_DIRS)):
+            storage.pack(day)
+        size, elapsed = measure(root)
+        print('bundles %8.1f MB  read %6.2fs' % (size / 1e6, elapsed))
+
+if __name__ == '__main__':
+    main()
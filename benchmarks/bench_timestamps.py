@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""process.to_unix_batch against the old per-row strptime/mktime to_unix.
+
+    benchmarks/bench_timestamps.py --rows 100000
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import process
+
+def legacy_to_unix(s):
+  return int(time.mktime(datetime.datetime.strptime(s,
+      "%Y-%m-%dT%H:%M:%S.0").timetuple())) + 3600
+
+def stamps(rows):
+    first = datetime.datetime(2020, 1, 1)
+    return [(first + datetime.timedelta(seconds=120 * n)).strftime('%Y-%m-%dT%H:%M:%S.0')
+            for n in range(rows)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    column = stamps(args.rows)
+    legacy = min(timeit.repeat(lambda: [legacy_to_unix(s) for s in column], number=1, repeat=3))
+    batch = min(timeit.repeat(lambda: process.to_unix_batch(column), number=1, repeat=3))
+    print('legacy to_unix  %8.3fs %12.0f rows/s' % (legacy, args.rows / legacy))
+    print('to_unix_batch   %8.3fs %12.0f rows/s (%.1fx)' % (batch, args.rows / batch, legacy / batch))
+
+if __name__ == '__main__':
+    main()
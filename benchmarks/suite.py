@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Throughput of every pipeline stage at 1x/10x/100x synthetic scale.
+
+Each scale writes BASE_DAYS days of day files and BASE_ACTIVITIES
+activities with GPX tracks, times the scale, into a scratch tree and
+runs the stages there with instrument recording to a scratch file:
+
+    process   process.ingest_days into a new me.db     rows/s
+    hrstore   HeartStore.update                         samples/s
+    tracks    render_tracks.render_all                  points/s
+    stats     ActivityIndex and stats.render            activities/s
+    badge     badge.total_distance, no cache            activities/s
+
+Units come from the spans the stages record themselves. Results are
+printed next to the previous run at the same scale and appended to
+benchmarks/history.jsonl together with the commit they ran on.
+
+    benchmarks/suite.py --scales 1 10 100
+"""
+
+from datetime import date
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '_dashboard'))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from activity_index import ActivityIndex
+from hrstore import HeartStore
+from render import Fragments
+import badge
+import instrument
+import process
+import render_tracks
+import stats
+import synth
+
+BASE_DAYS = 7
+BASE_ACTIVITIES = 10
+GPX_POINTS = 1000
+HISTORY = os.path.join(HERE, 'history.jsonl')
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def read_spans(path):
+    """Total seconds and numeric fields per span name"""
+    totals = {}
+    with open(path) as infile:
+        for line in infile:
+            record = json.loads(line)
+            if record['type'] != 'span':
+                continue
+            total = totals.setdefault(record['name'], {})
+            for key, value in record.items():
+                if key not in ('ts', 'pid') and isinstance(value, (int, float)):
+                    total[key] = total.get(key, 0) + value
+    return totals
+
+def run_stages(root):
+    """Run each stage in root, return {stage: (seconds, units, unit)}"""
+    metrics = os.path.join(root, 'metrics.jsonl')
+    instrument.configure(metrics)
+    timings = {}
+
+    def stage(name, fn):
+        started = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - started
+
+    os.chdir(root)
+    store = HeartStore('.')
+    stage('process', lambda: process.ingest_days('me.db'))
+    stage('hrstore', store.update)
+    stage('tracks', lambda: render_tracks.render_all('_activities', 'dist/_activities-svg',
+                                                     manifest_path='tracks.hashes.json'))
+    # a fresh fragment cache in the scratch tree, so every chart is drawn
+    stage('stats', lambda: stats.render(ActivityIndex('_activities'), store,
+                                        Fragments('stats', root)))
+    stage('badge', lambda: badge.total_distance('_activities'))
+    instrument.configure(None)
+
+    spans = read_spans(metrics)
+    activities = len([name for name in os.listdir('_activities') if name.endswith('.json')])
+    return {
+        'process': (timings['process'], spans['process.upsert']['rows'], 'rows'),
+        'hrstore': (timings['hrstore'], sum(day['count'] for day in store.index.values()), 'samples'),
+        'tracks': (timings['tracks'], spans['render_tracks.render']['points'], 'points'),
+        'stats': (timings['stats'], activities, 'activities'),
+        'badge': (timings['badge'], activities, 'activities'),
+    }
+
+def previous_rates(scale):
+    rates = {}
+    try:
+        with open(HISTORY) as infile:
+            for line in infile:
+                record = json.loads(line)
+                if record['scale'] == scale:
+                    rates[record['stage']] = record['rate']
+    except FileNotFoundError:
+        pass
+    return rates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--no-history', action='store_true',
+            help="don't append the results to benchmarks/history.jsonl")
+    args = parser.parse_args()
+
+    revision = commit()
+    cwd = os.getcwd()
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as root:
+            synth.write_days(root, BASE_DAYS * scale, first=date(2020, 11, 1))
+            synth.write_activities(os.path.join(root, '_activities'),
+                                   BASE_ACTIVITIES * scale, GPX_POINTS)
+            results = run_stages(root)
+            os.chdir(cwd)
+
+        previous = previous_rates(scale)
+        print('%dx: %d days, %d activities' % (scale, BASE_DAYS * scale, BASE_ACTIVITIES * scale))
+        records = []
+        for name, (seconds, units, unit) in results.items():
+            rate = units / seconds if seconds else 0
+            change = ''
+            if previous.get(name):
+                change = '%+6.1f%%' % ((rate / previous[name] - 1) * 100)
+            print('  %-8s %8.3fs %12.0f %s/s %s' % (name, seconds, rate, unit, change))
+            records.append({'ts': round(time.time()), 'commit': revision, 'scale': scale,
+                            'stage': name, 'seconds': round(seconds, 6), 'units': units,
+                            'unit': unit, 'rate': round(rate, 3)})
+
+        if not args.no_history:
+            with open(HISTORY, 'a') as outfile:
+                for record in records:
+                    outfile.write(json.dumps(record, sort_keys=True) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Synthetic Garmin data for the benchmarks, built from fake_garmin."""
+
+from datetime import date, timedelta
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_garmin import FakeGarmin
+
+DAY_FILES = {
+    'stats': 'get_stats',
+    'steps': 'get_steps_data',
+    'heart': 'get_heart_rates',
+    'sleep': 'get_sleep_data',
+}
+
+def write_days(root, days, first=date(2020, 1, 1)):
+    """Write `days` consecutive YYYY-MM-DD/*.dat directories under root"""
+    client = FakeGarmin()
+    for n in range(days):
+        isodate = (first + timedelta(n)).isoformat()
+        os.makedirs(os.path.join(root, isodate), exist_ok=True)
+        for kind, method in DAY_FILES.items():
+            with open(os.path.join(root, isodate, '%s.dat' % kind), 'w') as outfile:
+                json.dump(getattr(client, method)(isodate), outfile, sort_keys=True, indent=4)
+
+def write_gpx(path, points, segments=10):
+    with open(path, 'w') as outfile:
+        outfile.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<gpx version="1.1" creator="bench" xmlns="http://www.topografix.com/GPX/1/1">\n'
+                      '<trk><name>Synthetic</name>\n')
+        per_segment = points // segments
+        for segment in range(segments):
+            outfile.write('<trkseg>\n')
+            for i in range(segment * per_segment, (segment + 1) * per_segment):
+                outfile.write('<trkpt lat="%.7f" lon="%.7f"><ele>%.1f</ele>'
+                              '<time>2020-11-19T11:%02d:%02d.000Z</time></trkpt>\n'
+                              % (52.2 + i * 1e-5, 21.0 + (i % 1000) * 1e-5, 100 + i % 50,
+                                 i // 60 % 60, i % 60))
+            outfile.write('</trkseg>\n')
+        outfile.write('</trk>\n</gpx>\n')
+
+def write_activities(directory, count, points=1000):
+    """Write `count` activity JSONs, each with a GPX track of `points` points"""
+    os.makedirs(directory, exist_ok=True)
+    client = FakeGarmin(activities=count)
+    for activity in client.get_activities(0, count):
+        path = os.path.join(directory, 'activity_%s' % activity['activityId'])
+        with open(path + '.json', 'w') as outfile:
+            json.dump(activity, outfile, sort_keys=True, indent=4)
+        write_gpx(path + '.gpx', points)
@@ -1,7 +1,7 @@
 #!/bin/bash
 set -x
 echo "START: $0"
-cd /app/_dashboard && ./plot_tracks.sh && ./stats.py > index.html
-cp -R dist $STATS_DEST_DIR
-cp index.tml $STATS_DEST_INDEX
+cd /app/_dashboard && ./plot_tracks.sh && ./stats.py -o index.html && ./all_runs.py
+cp -Ru dist $STATS_DEST_DIR
+cp -u index.html $STATS_DEST_INDEX
 echo "END: $0"
@@ -7,76 +7,262 @@ from garminconnect import (
     GarminConnectAuthenticationError,
 )
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
 
+import argparse
 import json
 import logging
 import os
 import sys
+import threading
+import time
 
-logging.basicConfig(level=logging.DEBUG)
+from fake_garmin import FakeGarmin
+import instrument
+import session
+import storage
 
-if len(sys.argv) == 1:
-    isodate = date.today().isoformat()
-elif len(sys.argv) == 2:
-    if sys.argv[1] == 'yesterday':
-        isodate = (date.today() - timedelta(1)).isoformat()
-    else:
-        isodate = sys.argv[1]
+ACTIVITY_PAGE_SIZE = 10
+DOWNLOAD_WORKERS = 4
+MAX_RETRIES = 5
+
+# DEBUG also logs every HTTP request garminconnect makes
+LOG_LEVEL_ENV = 'ME_LOG_LEVEL'
+
+# file extension -> client.ActivityDownloadFormat member
+ACTIVITY_FORMATS = {
+    'csv': 'CSV',
+    'zip': 'ORIGINAL',
+    'gpx': 'GPX',
+    'tcx': 'TCX',
+}
+
+# day file -> client method
+DAY_FILES = {
+    'stats': 'get_stats',
+    'steps': 'get_steps_data',
+    'heart': 'get_heart_rates',
+    'sleep': 'get_sleep_data',
+}
+
+client = None
+
+class RateLimiter:
+    """Spaces out API calls made from any thread to at most `rate` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_call = 0
 
-os.makedirs(isodate, exist_ok=True)
-os.makedirs('_activities', exist_ok=True)
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
 
-email = os.environ['GARMIN_EMAIL']
-password = os.environ['GARMIN_PASS']
+limiter = RateLimiter(None)
 
-client = Garmin(email, password)
-client.login()
+def timed_call(fn, *args, **kwargs):
+    """fn(*args, **kwargs), recording its latency as garmin.<method>"""
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        instrument.observe('garmin.' + fn.__name__, time.perf_counter() - started)
 
-stats = client.get_stats(isodate)
-with open('%s/stats.dat' % isodate, 'w') as outfile:
-    json.dump(stats, outfile, sort_keys=True, indent=4)
+def with_backoff(fn, *args, **kwargs):
+    delay = 2
+    for attempt in range(MAX_RETRIES):
+        limiter.wait()
+        try:
+            return timed_call(fn, *args, **kwargs)
+        except GarminConnectTooManyRequestsError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            instrument.add('garmin.retries')
+            logging.warning("Too many requests, retrying in %ds", delay)
+            time.sleep(delay)
+            delay *= 2
 
-steps = client.get_steps_data(isodate)
-with open('%s/steps.dat' % isodate, 'w') as outfile:
-    json.dump(steps, outfile, sort_keys=True, indent=4)
+def day_complete(isodate):
+    """A day is complete once it is over and all its files hold data"""
+    if isodate >= date.today().isoformat():
+        return False
+    try:
+        day = storage.read_day(isodate)
+    except (OSError, ValueError, EOFError):
+        return False
+    return all(day.get(kind) is not None for kind in DAY_FILES)
 
-heart = client.get_heart_rates(isodate)
-with open('%s/heart.dat' % isodate, 'w') as outfile:
-    json.dump(heart, outfile, sort_keys=True, indent=4)
+def dump_day(isodate):
+    with instrument.span('daily.dump_day', day=isodate) as span:
+        day = {kind: with_backoff(getattr(client, method), isodate)
+               for kind, method in DAY_FILES.items()}
+        storage.write_day(isodate, day)
+        span['bytes'] = sum(os.path.getsize(path) for path in storage.day_paths(isodate))
+
+def activity_path(activity_id, ext):
+    return f"_activities/activity_{str(activity_id)}.{ext}"
+
+def activity_formats():
+    """Extensions to download. Bundle storage keeps only the ORIGINAL zip,
+    storage.derive_gpx() makes the GPX from it when needed."""
+    if storage.bundled():
+        return ['zip']
+    return list(ACTIVITY_FORMATS)
+
+def missing_formats(activity_id):
+    return [ext for ext in activity_formats()
+            if not os.path.exists(activity_path(activity_id, ext))]
+
+def download(activity_id, ext):
+    dl_fmt = getattr(client.ActivityDownloadFormat, ACTIVITY_FORMATS[ext])
+    data = with_backoff(client.download_activity, activity_id, dl_fmt=dl_fmt)
+    # write to a temp file first so an interrupted run doesn't leave a
+    # truncated file behind that would be skipped next time
+    output_file = activity_path(activity_id, ext)
+    storage.write_atomic(output_file, data)
+    instrument.add('daily.download_bytes', len(data))
+    instrument.add('daily.download_files')
+
+def write_activity(activity):
+    """Write an activity's JSON, atomically and only if it changed, so
+    readers never see half a file and unchanged files keep their mtime"""
+    output_file = activity_path(activity["activityId"], 'json')
+    text = json.dumps(activity, sort_keys=True, indent=4)
+    try:
+        with open(output_file, encoding="utf8") as infile:
+            if infile.read() == text:
+                return
+    except FileNotFoundError:
+        pass
+    storage.write_atomic(output_file, text.encode("utf8"))
 
 def dump_activities():
-    activities = client.get_activities(0, 10) 
-    if activities:
-        for activity in activities:
+    """Download whatever is missing in _activities/ for recent activities,
+    return the ids of activities that got new files.
+
+    Pages back through the activity list until it reaches an activity
+    that is already fully synced, so a regular run makes a single listing
+    call and a fresh checkout backfills the whole history. The JSON of
+    every activity on the first page is refreshed, picking up later
+    edits on Garmin's side such as names or vO2MaxValue."""
+    os.makedirs('_activities', exist_ok=True)
+    jobs = []
+    updated = []
+    start = 0
+    while True:
+        activities = with_backoff(client.get_activities, start, ACTIVITY_PAGE_SIZE)
+        synced = False
+        for activity in activities or []:
             activity_id = activity["activityId"]
-            csv_data = client.download_activity(activity_id, dl_fmt=client.ActivityDownloadFormat.CSV)
+            missing = missing_formats(activity_id)
 
-            output_file = f"_activities/activity_{str(activity_id)}.csv"
-            with open(output_file, "wb") as fb:
-                fb.write(csv_data)
+            if start == 0 or missing or not os.path.exists(activity_path(activity_id, 'json')):
+                write_activity(activity)
 
-            output_file = f"_activities/activity_{str(activity_id)}.json"
-            with open(output_file, "w", encoding="utf8") as fb:
-                json.dump(activity, fb, sort_keys=True, indent=4)
+            if not missing:
+                synced = True
+            else:
+                updated.append(activity_id)
+            jobs.extend((activity_id, ext) for ext in missing)
 
-            zip_data = client.download_activity(activity_id, dl_fmt=client.ActivityDownloadFormat.ORIGINAL)
-            output_file = f"_activities/activity_{str(activity_id)}.zip"
-            with open(output_file, "wb") as fb:
-                fb.write(zip_data)
+        if synced or not activities or len(activities) < ACTIVITY_PAGE_SIZE:
+            break
+        start += ACTIVITY_PAGE_SIZE
 
-            gpx_data = client.download_activity(activity_id, dl_fmt=client.ActivityDownloadFormat.GPX)
-            output_file = f"_activities/activity_{str(activity_id)}.gpx"
-            with open(output_file, "wb") as fb:
-                fb.write(gpx_data)
+    logging.info("Downloading %d activity files", len(jobs))
+    with instrument.span('daily.download', files=len(jobs), activities=len(updated)):
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            list(pool.map(lambda job: download(*job), jobs))
+    return updated
 
-            tcx_data = client.download_activity(activity_id, dl_fmt=client.ActivityDownloadFormat.TCX)
-            output_file = f"_activities/activity_{str(activity_id)}.tcx"
-            with open(output_file, "wb") as fb:
-                fb.write(tcx_data)
+def read_checkpoint(path):
+    try:
+        with open(path) as infile:
+            return set(line.strip() for line in infile if line.strip())
+    except FileNotFoundError:
+        return set()
+
+def backfill(start, end, workers, checkpoint):
+    """Dump every day in [start, end], resuming from the checkpoint file"""
+    done = read_checkpoint(checkpoint)
+    days = []
+    day = start
+    while day <= end:
+        isodate = day.isoformat()
+        if isodate not in done and not day_complete(isodate):
+            days.append(isodate)
+        day += timedelta(1)
+
+    logging.info("Backfilling %d days", len(days))
+    instrument.add('daily.backfill_days', len(days))
+    lock = threading.Lock()
+
+    def run(isodate):
+        dump_day(isodate)
+        # a day that isn't over yet will have more data next time
+        if isodate >= date.today().isoformat():
+            return
+        with lock, open(checkpoint, 'a') as outfile:
+            outfile.write(isodate + '\n')
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run, days))
+
+def parse_date(s):
+    if s == 'today':
+        return date.today()
+    if s == 'yesterday':
+        return date.today() - timedelta(1)
+    return date.fromisoformat(s)
+
+def connect():
+    """A logged in client, reusing the saved session when possible"""
+    if os.environ.get('GARMIN_FAKE'):
+        factory = FakeGarmin
+        email = password = None
+    else:
+        factory = Garmin
+        email = os.environ['GARMIN_EMAIL']
+        password = os.environ['GARMIN_PASS']
+    with instrument.span('daily.login'):
+        return session.get_client(email, password, factory=factory)
+
+def main():
+    global client, limiter
+
+    parser = argparse.ArgumentParser(description='Dump Garmin Connect data')
+    parser.add_argument('date', nargs='?', default='today', type=parse_date,
+            help="day to dump: YYYY-MM-DD, 'today' (default) or 'yesterday'")
+    parser.add_argument('--from', dest='start', type=parse_date,
+            help='first day of a range backfill')
+    parser.add_argument('--to', dest='end', type=parse_date,
+            help='last day of a range backfill (default: yesterday)')
+    parser.add_argument('--workers', type=int, default=4,
+            help='parallel day fetches during a backfill (default: 4)')
+    parser.add_argument('--rate', type=float, default=2.0,
+            help='max API calls per second during a backfill (default: 2)')
+    parser.add_argument('--checkpoint', default='.backfill_checkpoint',
+            help='file recording finished backfill days')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.environ.get(LOG_LEVEL_ENV, 'INFO').upper())
+    client = connect()
+
+    if args.start:
+        limiter = RateLimiter(args.rate)
+        end = args.end or date.today() - timedelta(1)
+        backfill(args.start, end, args.workers, args.checkpoint)
+    else:
+        dump_day(args.date.isoformat())
+        dump_activities()
 
-dump_activities()
+    session.save_session(client)
 
-sleep = client.get_sleep_data(isodate)
-with open('%s/sleep.dat' % isodate, 'w') as outfile:
-    json.dump(sleep, outfile, sort_keys=True, indent=4)
+if __name__ == '__main__':
+    main()
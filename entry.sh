@@ -2,6 +2,10 @@
 echo "Writing env"
 printenv
 printenv > /etc/environment
+if [ -n "$ME_SCHEDULER" ]; then
+    echo "Done. Running scheduler."
+    exec python3 /app/scheduler.py >> /var/log/jobs.log 2>&1
+fi
 echo "Done. Running scripts."
 /app/crontabs/run_daily_dump.sh
 /app/crontabs/backfill_yesterday.sh
@@ -0,0 +1,149 @@
+"""Offline stand-in for garminconnect.Garmin.
+
+Returns small, deterministic, Garmin-shaped payloads so daily.py and the
+jobs built on it can run without network access or credentials:
+
+    GARMIN_FAKE=1 ./daily.py 2020-11-19
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import base64
+import io
+import json
+import random
+import zipfile
+
+import fit
+
+ACTIVITY_TYPES = ['running', 'walking', 'cycling', 'indoor_cardio']
+
+class GarthStub:
+    def __init__(self):
+        self.token = None
+
+    def dumps(self):
+        return base64.b64encode(json.dumps({'token': self.token}).encode()).decode()
+
+class FakeGarmin:
+    class ActivityDownloadFormat:
+        ORIGINAL = 'ORIGINAL'
+        TCX = 'TCX'
+        GPX = 'GPX'
+        KML = 'KML'
+        CSV = 'CSV'
+
+    def __init__(self, email=None, password=None, activities=30):
+        self.email = email
+        self.garth = GarthStub()
+        self.activity_count = activities
+        self.logins = 0
+        self.calls = 0
+
+    def login(self, tokenstore=None):
+        if tokenstore:
+            self.garth.token = json.loads(base64.b64decode(tokenstore))['token']
+            if self.garth.token is None:
+                raise ValueError('Invalid session token')
+        else:
+            self.logins += 1
+            self.garth.token = 'token-%d' % self.logins
+
+    def _day(self, isodate):
+        self.calls += 1
+        return datetime.fromisoformat(isodate).replace(tzinfo=timezone.utc)
+
+    def get_stats(self, isodate):
+        self._day(isodate)
+        return {'calendarDate': isodate, 'totalSteps': 8000, 'restingHeartRate': 55}
+
+    def get_steps_data(self, isodate):
+        day = self._day(isodate)
+        rows = []
+        for i in range(96):
+            start = day + timedelta(minutes=15 * i)
+            rows.append({
+                'startGMT': start.strftime('%Y-%m-%dT%H:%M:%S.0'),
+                'endGMT': (start + timedelta(minutes=15)).strftime('%Y-%m-%dT%H:%M:%S.0'),
+                'steps': (i * 37) % 500,
+                'primaryActivityLevel': 'active' if i % 3 else 'sedentary',
+                'activityLevelConstant': bool(i % 2),
+            })
+        return rows
+
+    def get_heart_rates(self, isodate):
+        day = self._day(isodate)
+        start = int(day.timestamp()) * 1000
+        rng = random.Random(isodate)
+        values = []
+        for i in range(720):
+            bpm = None if i % 97 == 0 else 50 + rng.randrange(0, 90)
+            values.append([start + i * 120000, bpm])
+        return {'calendarDate': isodate, 'restingHeartRate': 55, 'heartRateValues': values}
+
+    def get_sleep_data(self, isodate):
+        day = self._day(isodate)
+        levels = []
+        for i in range(32):
+            start = day + timedelta(minutes=15 * i)
+            levels.append({
+                'startGMT': start.strftime('%Y-%m-%dT%H:%M:%S.0'),
+                'endGMT': (start + timedelta(minutes=15)).strftime('%Y-%m-%dT%H:%M:%S.0'),
+                'activityLevel': float(i % 4) / 2,
+            })
+        start = int(day.timestamp()) * 1000
+        return {
+            'dailySleepDTO': {
+                'id': start,
+                'calendarDate': isodate,
+                'sleepTimeSeconds': 27000,
+                'deepSleepSeconds': 6000,
+                'lightSleepSeconds': 15000,
+                'remSleepSeconds': 6000,
+                'awakeSleepSeconds': 900,
+            },
+            'sleepLevels': levels,
+            'sleepMovement': [dict(level) for level in levels],
+            'wellnessEpochRespirationDataDTOList': [
+                {'startTimeGMT': start + i * 60000, 'respirationValue': 12.0 + i % 5}
+                for i in range(0, 480, 4)
+            ],
+        }
+
+    def get_activities(self, start, limit):
+        self.calls += 1
+        first = datetime(2020, 11, 1, 7, 0)
+        activities = []
+        for n in range(self.activity_count - 1 - start, max(self.activity_count - 1 - start - limit, -1), -1):
+            typekey = ACTIVITY_TYPES[n % len(ACTIVITY_TYPES)]
+            started = first + timedelta(days=n)
+            activities.append({
+                'activityId': 5000000000 + n,
+                'activityName': 'Activity %d' % n,
+                'activityType': {'typeKey': typekey},
+                'startTimeGMT': started.strftime('%Y-%m-%d %H:%M:%S'),
+                'startTimeLocal': (started + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S'),
+                'distance': 0.0 if typekey == 'indoor_cardio' else 5000.0 + n * 10,
+                'duration': 1800.0 + n,
+                'calories': 300.0 + n,
+                'vO2MaxValue': 50.0 + n % 3 if typekey == 'running' else None,
+            })
+        return activities
+
+    def download_activity(self, activity_id, dl_fmt):
+        self.calls += 1
+        track = [(52.2 + i * 0.0001, 21.0 + (i % 50) * 0.0001) for i in range(200)]
+        if dl_fmt == self.ActivityDownloadFormat.GPX:
+            points = ''.join('<trkpt lat="%.6f" lon="%.6f"></trkpt>' % point for point in track)
+            return ('<?xml version="1.0" encoding="UTF-8"?>'
+                    '<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>%s</trkseg></trk></gpx>'
+                    % points).encode()
+        if dl_fmt == self.ActivityDownloadFormat.ORIGINAL:
+            # a zip holding the device's FIT file, like Garmin's
+            start = 1604214000 + activity_id % 1000 * 86400
+            records = [(start + i, lat, lon, None) for i, (lat, lon) in enumerate(track)]
+            archive = io.BytesIO()
+            with zipfile.ZipFile(archive, 'w') as z:
+                z.writestr('%s_ACTIVITY.fit' % activity_id, fit.encode(records))
+            return archive.getvalue()
+        return ('%s %s' % (activity_id, dl_fmt)).encode()
@@ -0,0 +1,165 @@
+"""Just enough of the FIT format to get a track out of an ORIGINAL download.
+
+Garmin's ORIGINAL activity download is a zip holding the .fit file the
+device recorded. read_records() walks its definition and data messages
+and yields the GPS fixes of every record message, to_gpx() turns them
+into a GPX track gpx2svg can draw. Everything else in the file is
+skipped.
+
+encode() writes a minimal FIT file of record messages, for fake_garmin
+and the benchmarks.
+"""
+
+from datetime import datetime, timezone
+
+import io
+import struct
+import zipfile
+
+# seconds between the Unix epoch and FIT's 1989-12-31T00:00:00Z
+FIT_EPOCH = 631065600
+SEMICIRCLES = 180.0 / 2 ** 31
+
+RECORD = 20
+TIMESTAMP = 253
+POSITION_LAT = 0
+POSITION_LONG = 1
+ALTITUDE = 2
+ENHANCED_ALTITUDE = 78
+
+# base type number -> (struct code, invalid value)
+BASE_TYPES = {
+    0x00: ('B', 0xff), 0x01: ('b', 0x7f), 0x02: ('B', 0xff),
+    0x83: ('h', 0x7fff), 0x84: ('H', 0xffff),
+    0x85: ('i', 0x7fffffff), 0x86: ('I', 0xffffffff),
+    0x8c: ('I', 0), 0x8b: ('H', 0), 0x0a: ('B', 0),
+    0x8e: ('q', 0x7fffffffffffffff), 0x8f: ('Q', 0xffffffffffffffff), 0x90: ('Q', 0),
+}
+
+CRC_TABLE = [0x0000, 0xcc01, 0xd801, 0x1400, 0xf001, 0x3c00, 0x2800, 0xe401,
+             0xa001, 0x6c00, 0x7800, 0xb401, 0x5000, 0x9c01, 0x8801, 0x4400]
+
+def crc(data, value=0):
+    for byte in data:
+        value = (value >> 4) ^ CRC_TABLE[value & 0xf] ^ CRC_TABLE[byte & 0xf]
+        value = (value >> 4) ^ CRC_TABLE[value & 0xf] ^ CRC_TABLE[byte >> 4]
+    return value
+
+class FitError(ValueError):
+    pass
+
+def decode_field(raw, base_type, endian):
+    fmt = BASE_TYPES.get(base_type)
+    if fmt is None or struct.calcsize(fmt[0]) != len(raw):
+        return None
+    value = struct.unpack(endian + fmt[0], raw)[0]
+    return None if value == fmt[1] else value
+
+def read_records(data):
+    """(timestamp, lat, lon, elevation) of every record message with a
+    position, timestamps in Unix seconds, elevation in metres or None"""
+    if len(data) < 12 or data[8:12] != b'.FIT':
+        raise FitError('not a FIT file')
+    header_size = data[0]
+    end = header_size + struct.unpack('<I', data[4:8])[0]
+    if end > len(data):
+        raise FitError('truncated FIT file')
+
+    definitions = {}
+    last_timestamp = 0
+    pos = header_size
+    while pos < end:
+        header = data[pos]
+        pos += 1
+        if header & 0x80:
+            # compressed timestamp header, a data message
+            local = (header >> 5) & 0x3
+            offset = header & 0x1f
+            timestamp = (last_timestamp & ~0x1f) + offset
+            if offset < last_timestamp & 0x1f:
+                timestamp += 0x20
+        elif header & 0x40:
+            local = header & 0xf
+            endian = '>' if data[pos + 1] else '<'
+            global_number = struct.unpack(endian + 'H', data[pos + 2:pos + 4])[0]
+            count = data[pos + 4]
+            pos += 5
+            fields = [tuple(data[pos + 3 * n:pos + 3 * n + 3]) for n in range(count)]
+            pos += 3 * count
+            extra = 0
+            if header & 0x20:
+                # developer fields: only their sizes matter
+                dev_count = data[pos]
+                extra = sum(data[pos + 1 + 3 * n + 1] for n in range(dev_count))
+                pos += 1 + 3 * dev_count
+            definitions[local] = (global_number, endian, fields, extra)
+            continue
+        else:
+            local = header & 0xf
+            timestamp = None
+
+        if local not in definitions:
+            raise FitError('data message without a definition')
+        global_number, endian, fields, extra = definitions[local]
+        values = {}
+        for number, size, base_type in fields:
+            values[number] = decode_field(data[pos:pos + size], base_type, endian)
+            pos += size
+        pos += extra
+
+        if values.get(TIMESTAMP) is not None:
+            timestamp = last_timestamp = values[TIMESTAMP]
+        elif timestamp is not None:
+            last_timestamp = timestamp
+
+        if global_number != RECORD:
+            continue
+        lat, lon = values.get(POSITION_LAT), values.get(POSITION_LONG)
+        if lat is None or lon is None:
+            continue
+        altitude = values.get(ENHANCED_ALTITUDE)
+        if altitude is None:
+            altitude = values.get(ALTITUDE)
+        yield (None if timestamp is None else timestamp + FIT_EPOCH,
+               lat * SEMICIRCLES, lon * SEMICIRCLES,
+               None if altitude is None else altitude / 5.0 - 500)
+
+def read_zip(data):
+    """The first .fit file in a zip, as bytes"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for name in archive.namelist():
+            if name.lower().endswith('.fit'):
+                return archive.read(name)
+    raise FitError('no .fit file in the zip')
+
+def to_gpx(records):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<gpx version="1.1" creator="me" xmlns="http://www.topografix.com/GPX/1/1">',
+             '<trk><trkseg>']
+    for timestamp, lat, lon, elevation in records:
+        point = '<trkpt lat="%.7f" lon="%.7f">' % (lat, lon)
+        if elevation is not None:
+            point += '<ele>%.1f</ele>' % elevation
+        if timestamp is not None:
+            point += '<time>%s</time>' % datetime.fromtimestamp(
+                timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        lines.append(point + '</trkpt>')
+    lines.append('</trkseg></trk>')
+    lines.append('</gpx>')
+    return '\n'.join(lines) + '\n'
+
+def encode(points):
+    """A FIT file of record messages for [(timestamp, lat, lon, elevation)]"""
+    body = io.BytesIO()
+    # definition of local message 0: record with timestamp, lat, long, altitude
+    body.write(struct.pack('<BBBHB', 0x40, 0, 0, RECORD, 4))
+    body.write(bytes([TIMESTAMP, 4, 0x86, POSITION_LAT, 4, 0x85,
+                      POSITION_LONG, 4, 0x85, ALTITUDE, 2, 0x84]))
+    for timestamp, lat, lon, elevation in points:
+        body.write(struct.pack('<BIiiH', 0, timestamp - FIT_EPOCH,
+                               round(lat / SEMICIRCLES), round(lon / SEMICIRCLES),
+                               0xffff if elevation is None else round((elevation + 500) * 5)))
+    body = body.getvalue()
+    header = struct.pack('<BBHI4s', 14, 0x20, 2132, len(body), b'.FIT')
+    header += struct.pack('<H', crc(header))
+    return header + body + struct.pack('<H', crc(header + body))
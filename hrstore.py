@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Columnar heart rate store.
+
+heart.dat files (or the heart part of day bundles, see storage.py) are
+packed per month into two flat files under _heart/:
+
+    YYYY-MM.ts    int64 seconds since the epoch, sorted
+    YYYY-MM.bpm   uint8 beats per minute, 0 where Garmin had no reading
+
+Months are keyed by the day directory a sample came from, and day
+directories don't overlap, so the months laid end to end stay sorted.
+_heart/index.json records each day's source mtime and its offset/count
+within the month, so only months with new or changed days are rebuilt.
+
+Reads mmap the month files and bisect the timestamp column, returning
+memoryview slices: a window query costs O(log n) plus the samples read.
+
+    ./hrstore.py            # update the store from ./YYYY-MM-DD/heart.dat
+"""
+
+from array import array
+from datetime import datetime, timezone
+
+import bisect
+import glob
+import json
+import mmap
+import os
+import sys
+
+import storage
+
+STORE_DIR = '_heart'
+
+def months_between(start, end):
+    """YYYY-MM keys from the month of start to the month of end"""
+    first = datetime.fromtimestamp(start, timezone.utc)
+    last = datetime.fromtimestamp(end, timezone.utc)
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        yield '%04d-%02d' % (year, month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+class HeartStore:
+    def __init__(self, root='.'):
+        self.root = root
+        self.dir = os.path.join(root, STORE_DIR)
+        self.index = {}
+        self.columns = {}
+        try:
+            with open(os.path.join(self.dir, 'index.json')) as infile:
+                self.index = json.load(infile)
+        except FileNotFoundError:
+            pass
+
+    def update(self):
+        """Pull new or changed heart.dat files in, return the rebuilt months"""
+        sources = {}
+        for day_dir in glob.glob(os.path.join(self.root, storage.DAY_DIRS)):
+            path = storage.kind_path(day_dir, 'heart')
+            if path is not None:
+                sources[os.path.basename(day_dir)] = (day_dir, os.stat(path).st_mtime)
+
+        stale = set(day[:7] for day, (_, mtime) in sources.items()
+                    if self.index.get(day, {}).get('mtime') != mtime)
+        stale |= set(day[:7] for day in self.index if day not in sources)
+        if not stale:
+            return []
+
+        os.makedirs(self.dir, exist_ok=True)
+        for month in sorted(stale):
+            self.build_month(month, {day: source for day, source in sources.items()
+                                     if day.startswith(month)})
+        storage.write_atomic(os.path.join(self.dir, 'index.json'),
+                     json.dumps(self.index, sort_keys=True).encode())
+        return sorted(stale)
+
+    def build_month(self, month, sources):
+        ts = array('q')
+        bpm = array('B')
+        for day in [day for day in self.index if day.startswith(month)]:
+            del self.index[day]
+        for day in sorted(sources):
+            day_dir, mtime = sources[day]
+            values = (storage.read_kind(day_dir, 'heart') or {}).get('heartRateValues') or []
+            offset = len(ts)
+            for t, rate in sorted(values, key=lambda row: row[0]):
+                ts.append(t // 1000)
+                bpm.append(rate or 0)
+            self.index[day] = {'mtime': mtime, 'offset': offset, 'count': len(ts) - offset}
+
+        # readers may still hold views of the old mapping, let them keep it
+        self.columns.pop(month, None)
+        storage.write_atomic(os.path.join(self.dir, month + '.ts'), ts.tobytes())
+        storage.write_atomic(os.path.join(self.dir, month + '.bpm'), bpm.tobytes())
+
+    def month(self, month):
+        """(timestamps, bpm) memoryviews over a month's mapped files"""
+        if month not in self.columns:
+            views = []
+            for ext, fmt in (('.ts', 'q'), ('.bpm', 'B')):
+                try:
+                    with open(os.path.join(self.dir, month + ext), 'rb') as infile:
+                        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+                    views.append(memoryview(data).cast(fmt))
+                except (FileNotFoundError, ValueError):
+                    # missing or empty month
+                    views.append(memoryview(array(fmt)))
+            self.columns[month] = tuple(views)
+        return self.columns[month]
+
+    def day(self, isodate):
+        """All samples that came from one day's heart.dat"""
+        entry = self.index.get(isodate)
+        if entry is None:
+            return memoryview(array('q')), memoryview(array('B'))
+        ts, bpm = self.month(isodate[:7])
+        end = entry['offset'] + entry['count']
+        return ts[entry['offset']:end], bpm[entry['offset']:end]
+
+    def window(self, start, end):
+        """Samples with start <= timestamp < end, in seconds since the epoch.
+
+        A window within one month is returned as zero-copy views, one
+        spanning months is joined into new arrays."""
+        chunks = []
+        # a day directory can hold samples from the neighbouring UTC day
+        for month in months_between(start - 86400, end + 86400):
+            ts, bpm = self.month(month)
+            if not len(ts) or ts[-1] < start or ts[0] >= end:
+                continue
+            i = bisect.bisect_left(ts, start)
+            j = bisect.bisect_left(ts, end)
+            chunks.append((ts[i:j], bpm[i:j]))
+
+        if len(chunks) == 1:
+            return chunks[0]
+        ts, bpm = array('q'), array('B')
+        for chunk_ts, chunk_bpm in chunks:
+            ts.frombytes(chunk_ts.tobytes())
+            bpm.frombytes(chunk_bpm.tobytes())
+        return memoryview(ts), memoryview(bpm)
+
+def downsample(rates, points):
+    """Average rates into at most `points` buckets, skipping missing (0)
+    readings. A bucket with no readings at all comes out as 0."""
+    if len(rates) <= points:
+        return list(rates)
+    averaged = []
+    for n in range(points):
+        bucket = [r for r in rates[n * len(rates) // points:(n + 1) * len(rates) // points] if r]
+        averaged.append(round(sum(bucket) / len(bucket)) if bucket else 0)
+    return averaged
+
+def main():
+    store = HeartStore(sys.argv[1] if len(sys.argv) > 1 else '.')
+    for month in store.update():
+        print('Rebuilt %s' % month)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Incremental upserts of day files into me.db.
+
+Tables keep the layout sqlite-utils gave them (an `id` primary key plus
+one column per JSON key, nested values stored as JSON text), so an
+existing me.db keeps working. The `_ingested` table remembers the
+mtime and content hash of every day directory already loaded. Only new
+or changed days are read again.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+MANIFEST = '_ingested'
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS %s '
+                 '(day TEXT PRIMARY KEY, mtime FLOAT, hash TEXT)' % MANIFEST)
+    return conn
+
+def day_signature(files):
+    """Newest mtime and a content hash over all files of a day"""
+    mtime = max(os.stat(f).st_mtime for f in files)
+    digest = hashlib.sha1()
+    for f in sorted(files):
+        digest.update(f.encode())
+        with open(f, 'rb') as infile:
+            digest.update(infile.read())
+    return mtime, digest.hexdigest()
+
+def changed(conn, day, files):
+    """Return the new signature if the day needs ingesting, else None"""
+    row = conn.execute('SELECT mtime, hash FROM %s WHERE day = ?' % MANIFEST,
+                       (day,)).fetchone()
+    mtime = max(os.stat(f).st_mtime for f in files)
+    if row is not None and row[0] == mtime:
+        return None
+    mtime, digest = day_signature(files)
+    if row is not None and row[1] == digest:
+        # touched but identical, just remember the new mtime
+        conn.execute('UPDATE %s SET mtime = ? WHERE day = ?' % MANIFEST, (mtime, day))
+        return None
+    return mtime, digest
+
+def mark(conn, day, signature):
+    conn.execute('INSERT OR REPLACE INTO %s (day, mtime, hash) VALUES (?, ?, ?)'
+                 % MANIFEST, (day,) + tuple(signature))
+
+def column_type(value):
+    if isinstance(value, bool) or isinstance(value, int):
+        return 'INTEGER'
+    if isinstance(value, float):
+        return 'FLOAT'
+    return 'TEXT'
+
+def sql_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+def ensure_table(conn, table, rows):
+    """Create the table or add columns so every key in rows has a home"""
+    types = {}
+    for row in rows:
+        for key, value in row.items():
+            if types.get(key) is None and value is not None:
+                types[key] = column_type(value)
+            types.setdefault(key, None)
+
+    existing = [r[1] for r in conn.execute('PRAGMA table_info([%s])' % table)]
+    if not existing:
+        columns = ['[id] %s PRIMARY KEY' % (types.pop('id', None) or 'INTEGER')]
+        columns += ['[%s] %s' % (k, t or 'TEXT') for k, t in types.items()]
+        conn.execute('CREATE TABLE [%s] (%s)' % (table, ', '.join(columns)))
+        return
+    for key, t in types.items():
+        if key not in existing:
+            conn.execute('ALTER TABLE [%s] ADD COLUMN [%s] %s' % (table, key, t or 'TEXT'))
+
+def upsert(conn, table, rows, range_column=None):
+    """Insert or replace rows (dicts with an `id`) with one executemany.
+
+    With range_column, stored rows whose value of it falls within the
+    new rows' range are deleted first, so a day is replaced as a whole
+    even where its rows were stored under ids computed differently."""
+    rows = [row for row in rows if row and row.get('id') is not None]
+    if not rows:
+        return 0
+    ensure_table(conn, table, rows)
+    if range_column is not None:
+        values = [row[range_column] for row in rows if row.get(range_column) is not None]
+        if values:
+            conn.execute('DELETE FROM [%s] WHERE [%s] BETWEEN ? AND ?' % (table, range_column),
+                         (min(values), max(values)))
+    keys = []
+    for row in rows:
+        for key in row:
+            if key not in keys:
+                keys.append(key)
+    sql = 'INSERT OR REPLACE INTO [%s] (%s) VALUES (%s)' % (
+            table, ', '.join('[%s]' % k for k in keys), ', '.join('?' * len(keys)))
+    conn.executemany(sql, ([sql_value(row.get(k)) for k in keys] for row in rows))
+    return len(rows)
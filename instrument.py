@@ -0,0 +1,108 @@
+"""Timing spans and counters, written as JSON lines.
+
+Nothing is recorded unless ME_METRICS names a file (or '-' for stderr).
+Every finished span is appended as one line:
+
+    {"type": "span", "name": "process.upsert", "seconds": 0.041,
+     "rows": 977, "script": "process.py", "pid": 123, "ts": 1604275200.0}
+
+Counters and call latencies (count, add, observe) accumulate in memory
+and are written as a single "counters" line when the process exits.
+Lines are appended with O_APPEND, so pool workers and concurrent jobs
+can share one file.
+
+    with instrument.span('daily.download', activity=activity_id) as fields:
+        data = ...
+        fields['bytes'] = len(data)
+"""
+
+from contextlib import contextmanager
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+METRICS_ENV = 'ME_METRICS'
+
+class Metrics:
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def write(self, record):
+        record.update(script=self.script, pid=os.getpid(), ts=round(time.time(), 3))
+        line = json.dumps(record, sort_keys=True) + '\n'
+        if self.path == '-':
+            sys.stderr.write(line)
+            return
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Time a block. Fields set on the yielded dict, like rows or
+        bytes, are written with it."""
+        if not self.enabled:
+            yield fields
+            return
+        started = time.perf_counter()
+        error = None
+        try:
+            yield fields
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            record = dict(fields, type='span', name=name,
+                          seconds=round(time.perf_counter() - started, 6))
+            if error:
+                record['error'] = error
+            self.write(record)
+
+    def add(self, name, value=1):
+        """Add to a counter, e.g. bytes downloaded"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record one call's latency: count, total and max per name"""
+        if not self.enabled:
+            return
+        with self.lock:
+            stats = self.counters.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max': 0.0})
+            stats['calls'] += 1
+            stats['seconds'] = round(stats['seconds'] + seconds, 6)
+            stats['max'] = round(max(stats['max'], seconds), 6)
+
+    def flush(self):
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        if self.enabled and counters:
+            self.write({'type': 'counters', 'counters': counters})
+
+metrics = Metrics(os.environ.get(METRICS_ENV))
+atexit.register(metrics.flush)
+
+span = metrics.span
+add = metrics.add
+observe = metrics.observe
+flush = metrics.flush
+
+def configure(path):
+    """Start (or with None, stop) recording to path from inside a process"""
+    metrics.flush()
+    metrics.path = path
@@ -1,95 +1,213 @@
 #!/usr/bin/env python3
 
-from pprint import pp
 from collections import defaultdict
 from pathlib import Path
+import argparse
+import calendar
 import glob
 import json
+import logging
 import os
-import sys
-import itertools
-import time, datetime
-
-def to_unix(s):
-  return int(time.mktime(datetime.datetime.strptime(s,
-      "%Y-%m-%dT%H:%M:%S.0").timetuple())) + 3600
-
-def load_all(files):
-    contents = []
-    for f in files:
-        with open(f) as json_file:
-          contents.append(json.load(json_file))
-    return contents
-
-def flatten(stuff):
-    return list(itertools.chain(*stuff))
-
-def concat_objects(stuff):
-    return list(itertools.chain(stuff))
-
-def add_pk(obj, fn):
-    obj['id'] = fn(obj)
-
-datasets = defaultdict(list)
-
-for filename in glob.iglob('2020-*/*.dat', recursive=True):
-     kind = Path(filename).stem     
-     datasets[kind].append(filename)
-
-steps = flatten(load_all(datasets['steps']))
-steps = list(
-        map(
-            lambda x: x.setdefault('id', to_unix(x['endGMT'])) and x, 
-            steps))
-
-sleep_data = load_all(datasets['sleep'])
-
-sleep_activity_levels = flatten([s['sleepLevels'] for s in sleep_data])
-sleep_activity_levels = [sal for sal in sleep_activity_levels if sal['activityLevel'] > 0.0]
-sleep_activity_levels = list(
-        map(
-            lambda x: x.setdefault('id', to_unix(x['startGMT'])) and x, 
-            sleep_activity_levels))
-
-
-sleep_movements = flatten([s['sleepMovement'] for s in sleep_data])
-sleep_movements = [sm for sm in sleep_movements if sm['activityLevel'] > 0.0]
-sleep_movements = list(
-        map(
-            lambda x: x.setdefault('id', to_unix(x['startGMT'])) and x, 
-            sleep_movements))
-
-
-respirations = flatten([s.get('wellnessEpochRespirationDataDTOList') for s in
-    sleep_data if s.get('wellnessEpochRespirationDataDTOList') is not None])
-respirations = list(
-        map(
-            lambda x: x.setdefault('id', x['startTimeGMT']) and x, 
-            respirations))
-
-daily_sleep_data = concat_objects([s['dailySleepDTO'] for s in sleep_data])
-
-heart = load_all(datasets['heart'])
-heart_rates = flatten([s['heartRateValues'] for s in heart])
-heart_rates = [
-        {'timestamp': h[0] // 1000, 'rate': h[1], 'id': h[0] // 1000} 
-        for h in heart_rates if h[1] is not None
-        ]
-
-with open('sqlite-input/steps.json', 'w') as outfile:
-    json.dump(steps, outfile, sort_keys=True, indent=4)
-
-with open('sqlite-input/sleep_activity_levels.json', 'w') as outfile:
-    json.dump(sleep_activity_levels, outfile, sort_keys=True, indent=4)
-
-with open('sqlite-input/sleep_movements.json', 'w') as outfile:
-    json.dump(sleep_movements, outfile, sort_keys=True, indent=4)
-
-with open('sqlite-input/respirations.json', 'w') as outfile:
-    json.dump(respirations, outfile, sort_keys=True, indent=4)
-
-with open('sqlite-input/daily_sleep_data.json', 'w') as outfile:
-    json.dump(daily_sleep_data, outfile, sort_keys=True, indent=4)
-
-with open('sqlite-input/heart_rates.json', 'w') as outfile:
-    json.dump(heart_rates, outfile, sort_keys=True, indent=4)
+import multiprocessing
+
+import ingest
+import instrument
+import rollups
+import storage
+
+# YYYY-MM-DD -> seconds since the epoch at 00:00 GMT
+_day_starts = {}
+
+def to_unix_batch(stamps):
+    """Seconds since the epoch for a column of "%Y-%m-%dT%H:%M:%S.0" GMT
+    timestamps. The layout is fixed, so fields are sliced out directly and
+    the date part is converted once per distinct day."""
+    ids = []
+    for s in stamps:
+        day = s[:10]
+        start = _day_starts.get(day)
+        if start is None:
+            start = _day_starts[day] = calendar.timegm(
+                    (int(s[0:4]), int(s[5:7]), int(s[8:10]), 0, 0, 0))
+        ids.append(start + int(s[11:13]) * 3600 + int(s[14:16]) * 60 + int(s[17:19]))
+    return ids
+
+# Per day file transforms: each takes one parsed .dat file and yields
+# the rows it contributes to a table, so no stage holds more than one
+# day in memory.
+
+def steps_rows(steps):
+    ids = to_unix_batch([x['endGMT'] for x in steps])
+    for x, pk in zip(steps, ids):
+        yield x.setdefault('id', pk) and x
+
+def sleep_activity_level_rows(sleep):
+    levels = [x for x in sleep['sleepLevels'] if x['activityLevel'] > 0.0]
+    ids = to_unix_batch([x['startGMT'] for x in levels])
+    for x, pk in zip(levels, ids):
+        yield x.setdefault('id', pk) and x
+
+def sleep_movement_rows(sleep):
+    movements = [x for x in sleep['sleepMovement'] if x['activityLevel'] > 0.0]
+    ids = to_unix_batch([x['startGMT'] for x in movements])
+    for x, pk in zip(movements, ids):
+        yield x.setdefault('id', pk) and x
+
+def respiration_rows(sleep):
+    for x in sleep.get('wellnessEpochRespirationDataDTOList') or []:
+        yield x.setdefault('id', x['startTimeGMT']) and x
+
+def daily_sleep_rows(sleep):
+    yield sleep['dailySleepDTO']
+
+def heart_rate_rows(heart):
+    for h in heart['heartRateValues']:
+        if h[1] is not None:
+            yield {'timestamp': h[0] // 1000, 'rate': h[1], 'id': h[0] // 1000}
+
+# table -> (day file kind, transform, sqlite-input file)
+TABLES = {
+    'steps': ('steps', steps_rows, 'steps.json'),
+    'daily_sleep': ('sleep', daily_sleep_rows, 'daily_sleep_data.json'),
+    'heart_rates': ('heart', heart_rate_rows, 'heart_rates.json'),
+    'respirations': ('sleep', respiration_rows, 'respirations.json'),
+    'sleep_movements': ('sleep', sleep_movement_rows, 'sleep_movements.json'),
+    'sleep_activity_levels': ('sleep', sleep_activity_level_rows, 'sleep_activity_levels.json'),
+}
+
+# table -> the GMT column its ids are computed from. Ids made before
+# to_unix_batch() were an hour off, re-ingesting a day deletes its rows
+# by this column rather than leaving them next to the new ids.
+RANGE_COLUMNS = {
+    'steps': 'endGMT',
+    'sleep_movements': 'startGMT',
+    'sleep_activity_levels': 'startGMT',
+}
+
+def encode_row(row):
+    """A row as it appears inside an indent=4 JSON array"""
+    return json.dumps(row, sort_keys=True, indent=4).replace('\n', '\n    ')
+
+class JsonArraySink:
+    """Streams rows into a file that reads exactly like
+    json.dump(rows, outfile, sort_keys=True, indent=4)"""
+
+    def __init__(self, path):
+        self.outfile = open(path, 'w')
+        self.empty = True
+
+    def write(self, row):
+        self.write_encoded(encode_row(row))
+
+    def write_encoded(self, text):
+        self.outfile.write('[\n    ' if self.empty else ',\n    ')
+        self.outfile.write(text)
+        self.empty = False
+
+    def close(self):
+        self.outfile.write('[]' if self.empty else '\n]')
+        self.outfile.close()
+
+def encode_day_file(job):
+    """Parse and normalise one kind of a day into encoded rows per table"""
+    kind, day_dir = job
+    parsed = storage.read_kind(day_dir, kind)
+    return [(table, [encode_row(row) for row in transform(parsed)])
+            for table, (table_kind, transform, _) in TABLES.items()
+            if table_kind == kind]
+
+def parse_day(day_dir):
+    """Parse and normalise all of one day's data into rows per table"""
+    with instrument.span('process.parse_day', day=day_dir) as span:
+        parsed = storage.read_day(day_dir)
+        tables = {table: list(transform(parsed[kind]))
+                  for table, (kind, transform, _) in TABLES.items()
+                  if parsed.get(kind) is not None}
+        span['bytes'] = sum(os.path.getsize(f) for f in storage.day_paths(day_dir))
+        span['rows'] = sum(len(rows) for rows in tables.values())
+    return tables
+
+def pool_map(fn, jobs, workers):
+    """Like map(), but spread over a process pool when workers > 1.
+    Results come back in job order either way."""
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            yield from pool.imap(fn, jobs, chunksize=4)
+    else:
+        yield from map(fn, jobs)
+
+def ingest_days(db, workers=1):
+    """Upsert new or changed day directories into the SQLite database"""
+    conn = ingest.connect(db)
+    pending = []
+    with instrument.span('process.scan') as span:
+        days = sorted(glob.glob(storage.DAY_DIRS))
+        for day in days:
+            files = storage.day_paths(day)
+            if not files:
+                continue
+            signature = ingest.changed(conn, day, files)
+            if signature is not None:
+                pending.append((day, signature))
+        span.update(days=len(days), changed=len(pending))
+    rollups.ensure(conn)
+    conn.commit()
+
+    parsed_days = pool_map(parse_day, [day for day, _ in pending], workers)
+    for (day, signature), tables in zip(pending, parsed_days):
+        with conn, instrument.span('process.upsert', day=day) as span:
+            rows = 0
+            for table, table_rows in tables.items():
+                rows += ingest.upsert(conn, table, table_rows, RANGE_COLUMNS.get(table))
+            with instrument.span('process.rollups', day=day):
+                rollups.refresh(conn, tables)
+            ingest.mark(conn, day, signature)
+            span['rows'] = rows
+        logging.info("Ingested %s: %d rows", day, rows)
+    with conn:
+        rollups.create_indexes(conn)
+    conn.close()
+
+def dump_json(workers=1):
+    datasets = defaultdict(list)
+
+    for filename in glob.iglob('2020-*/*.dat', recursive=True):
+         kind = Path(filename).stem
+         datasets[kind].append(os.path.dirname(filename))
+    for filename in glob.iglob('2020-*/' + storage.BUNDLE):
+         for kind in storage.KINDS:
+             datasets[kind].append(os.path.dirname(filename))
+
+    sinks = {table: JsonArraySink('sqlite-input/%s' % name)
+             for table, (_, _, name) in TABLES.items()}
+
+    # one parse per day file, fanned out to every table it feeds
+    jobs = [(kind, day) for kind in ('steps', 'sleep', 'heart') for day in datasets[kind]]
+    with instrument.span('process.dump_json', files=len(jobs)) as span:
+        span['rows'] = 0
+        for tables in pool_map(encode_day_file, jobs, workers):
+            for table, rows in tables:
+                span['rows'] += len(rows)
+                for text in rows:
+                    sinks[table].write_encoded(text)
+
+        for sink in sinks.values():
+            sink.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Prepare Garmin day files for me.db')
+    parser.add_argument('--db', metavar='FILE',
+            help='upsert new or changed days straight into this SQLite '
+                 'database instead of writing sqlite-input/*.json')
+    parser.add_argument('--jobs', '-j', metavar='N', type=int, default=1,
+            help='parse day files in N worker processes (default: 1)')
+    args = parser.parse_args()
+
+    if args.db:
+        logging.basicConfig(level=logging.INFO)
+        ingest_days(args.db, args.jobs)
+    else:
+        dump_json(args.jobs)
+
+if __name__ == '__main__':
+    main()
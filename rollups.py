@@ -0,0 +1,152 @@
+"""Materialised rollups in me.db.
+
+Charts over weeks or months don't need every heart rate sample, so
+ingestion keeps summary tables next to the raw ones:
+
+    heart_rates_minutely/_hourly/_daily   min, avg, max rate and samples
+    steps_hourly/_daily                   step sums
+    sleep_daily                           sleep totals per calendar date
+
+Buckets are UTC, keyed by the epoch second they start at. A steps row
+counts toward the bucket its interval starts in. When a day is ingested
+only the buckets its rows fall into are recomputed.
+"""
+
+VERSIONS_TABLE = '_rollups'
+
+HEART_RATES = [
+    ('heart_rates_minutely', 60),
+    ('heart_rates_hourly', 3600),
+    ('heart_rates_daily', 86400),
+]
+
+STEPS = [
+    ('steps_hourly', 3600),
+    ('steps_daily', 86400),
+]
+
+# steps ids are the end of a 15 minute interval
+STEP_INTERVAL = 900
+
+# table -> version, bump to rebuild a table from the raw data on the
+# next ingest. Tables from before versions were recorded are version 1.
+VERSIONS = {
+    'steps_hourly': 2,  # bucketed by interval start, not end
+    'steps_daily': 2,
+}
+
+SLEEP_FIELDS = [
+    ('sleep_seconds', 'sleepTimeSeconds'),
+    ('deep_seconds', 'deepSleepSeconds'),
+    ('light_seconds', 'lightSleepSeconds'),
+    ('rem_seconds', 'remSleepSeconds'),
+    ('awake_seconds', 'awakeSleepSeconds'),
+]
+
+INDEXES = [
+    ('heart_rates', 'timestamp'),
+    ('daily_sleep', 'calendarDate'),
+]
+
+def table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (table,)).fetchone() is not None
+
+def outdated(conn, table):
+    """True if table is missing or was built by an older version"""
+    if not table_exists(conn, table):
+        return True
+    row = conn.execute('SELECT version FROM %s WHERE name = ?' % VERSIONS_TABLE,
+                       (table,)).fetchone()
+    return (row[0] if row else 1) < VERSIONS.get(table, 1)
+
+def ensure(conn):
+    """Create missing or outdated rollup tables and indexes, filling new
+    tables from whatever is already in the raw tables"""
+    conn.execute('CREATE TABLE IF NOT EXISTS %s (name TEXT PRIMARY KEY, version INTEGER)'
+                 % VERSIONS_TABLE)
+    created = set()
+    for table in [table for table, _ in HEART_RATES + STEPS] + ['sleep_daily']:
+        if outdated(conn, table):
+            conn.execute('DROP TABLE IF EXISTS [%s]' % table)
+            conn.execute('INSERT OR REPLACE INTO %s (name, version) VALUES (?, ?)'
+                         % VERSIONS_TABLE, (table, VERSIONS.get(table, 1)))
+
+    for table, _ in HEART_RATES:
+        if not table_exists(conn, table):
+            conn.execute('CREATE TABLE [%s] (bucket INTEGER PRIMARY KEY, min_rate INTEGER, '
+                         'avg_rate FLOAT, max_rate INTEGER, samples INTEGER)' % table)
+            created.add(table)
+    for table, _ in STEPS:
+        if not table_exists(conn, table):
+            conn.execute('CREATE TABLE [%s] (bucket INTEGER PRIMARY KEY, steps INTEGER)' % table)
+            created.add(table)
+    if not table_exists(conn, 'sleep_daily'):
+        conn.execute('CREATE TABLE sleep_daily (day TEXT PRIMARY KEY, %s)'
+                     % ', '.join('%s INTEGER' % column for column, _ in SLEEP_FIELDS))
+        created.add('sleep_daily')
+
+    create_indexes(conn)
+
+    if created and table_exists(conn, 'heart_rates'):
+        start, end = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM heart_rates').fetchone()
+        if start is not None:
+            refresh_heart_rates(conn, start, end)
+    if created and table_exists(conn, 'steps'):
+        start, end = conn.execute('SELECT MIN(id) - ?, MAX(id) - ? FROM steps',
+                                  (STEP_INTERVAL, STEP_INTERVAL)).fetchone()
+        if start is not None:
+            refresh_steps(conn, start, end)
+    if created and table_exists(conn, 'daily_sleep'):
+        days = [row[0] for row in conn.execute('SELECT DISTINCT calendarDate FROM daily_sleep')]
+        refresh_sleep(conn, days)
+
+def create_indexes(conn):
+    """Timestamp indexes on the raw tables, once they exist"""
+    for table, column in INDEXES:
+        if table_exists(conn, table):
+            conn.execute('CREATE INDEX IF NOT EXISTS [%s_%s] ON [%s] ([%s])'
+                         % (table, column, table, column))
+
+def refresh_buckets(conn, table, size, start, end, select):
+    first = start - start % size
+    last = end - end % size
+    conn.execute('DELETE FROM [%s] WHERE bucket BETWEEN ? AND ?' % table, (first, last))
+    conn.execute('INSERT INTO [%s] %s' % (table, select % {'size': size, 'interval': STEP_INTERVAL}),
+                 (first, last + size))
+
+def refresh_heart_rates(conn, start, end):
+    for table, size in HEART_RATES:
+        refresh_buckets(conn, table, size, start, end,
+                'SELECT timestamp - timestamp %% %(size)d AS bucket, MIN(rate), AVG(rate), '
+                'MAX(rate), COUNT(*) FROM heart_rates '
+                'WHERE timestamp >= ? AND timestamp < ? GROUP BY bucket')
+
+def refresh_steps(conn, start, end):
+    """start and end are interval starts"""
+    for table, size in STEPS:
+        refresh_buckets(conn, table, size, start, end,
+                'SELECT (id - %(interval)d) - (id - %(interval)d) %% %(size)d AS bucket, '
+                'SUM(steps) FROM steps WHERE id >= ? + %(interval)d AND id < ? + %(interval)d '
+                'GROUP BY bucket')
+
+def refresh_sleep(conn, days):
+    for day in days:
+        conn.execute('DELETE FROM sleep_daily WHERE day = ?', (day,))
+        conn.execute('INSERT INTO sleep_daily SELECT calendarDate, %s FROM daily_sleep '
+                     'WHERE calendarDate = ? GROUP BY calendarDate'
+                     % ', '.join('SUM([%s])' % field for _, field in SLEEP_FIELDS), (day,))
+
+def refresh(conn, tables):
+    """Recompute the buckets touched by freshly ingested rows, given as
+    {table: rows} the way process.parse_day() returns them"""
+    heart_rates = [row['timestamp'] for row in tables.get('heart_rates', [])]
+    if heart_rates:
+        refresh_heart_rates(conn, min(heart_rates), max(heart_rates))
+    steps = [row['id'] - STEP_INTERVAL for row in tables.get('steps', []) if row]
+    if steps:
+        refresh_steps(conn, min(steps), max(steps))
+    days = set(row.get('calendarDate') for row in tables.get('daily_sleep', []) if row)
+    days.discard(None)
+    if days:
+        refresh_sleep(conn, sorted(days))
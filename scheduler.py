@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Run the crontab.txt jobs from one long-lived process.
+
+Jobs run on the schedules in crontab.txt as asyncio tasks, with the
+Garmin session, the activity index and the heart rate store kept warm
+between runs. Scripts with a native job below run in-process, anything
+else in the crontab is run as a shell command like crond would.
+
+A job is never run twice at the same time: triggering it while it runs
+queues a single rerun for when it finishes. A dump that downloads new
+activities triggers the track/stats render and the badge right away
+instead of waiting for their next slot.
+
+Every job runs once at startup, in crontab order, like entry.sh did.
+
+    ./scheduler.py
+    ./scheduler.py --fake-clock 2020-11-02T00:00 --minutes 360
+
+--fake-clock replays the schedule from START against fake_garmin
+without waiting, letting each minute's jobs finish before moving on.
+It writes into the tree like a real run, so use a scratch copy.
+"""
+
+from datetime import datetime, timedelta
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '_dashboard'))
+sys.path.insert(0, os.path.join(HERE, 'scripts'))
+
+from activity_index import ActivityIndex
+from hrstore import HeartStore
+from render import Fragments, write_if_changed
+import all_runs
+import badge
+import daily
+import heart_chart
+import instrument
+import plot_heart
+import render_tracks
+import session
+import stats
+
+CRONTAB = os.path.join(HERE, 'crontab.txt')
+
+# minute, hour, day of month, month, day of week (0 and 7 are Sunday)
+FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+def parse_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            first, last = low, high
+        elif '-' in part:
+            first, last = map(int, part.split('-'))
+        else:
+            first = last = int(part)
+        if first < low or last > high or first > last or step < 1:
+            raise ValueError('bad crontab field %r' % field)
+        values.update(range(first, last + 1, step))
+    return values
+
+class Schedule:
+    """The five time fields of a crontab line"""
+
+    def __init__(self, fields):
+        self.minute, self.hour, self.day, self.month, weekday = [
+            parse_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES)]
+        self.weekday = set(value % 7 for value in weekday)
+        # like cron, a day matches either field when both are restricted
+        self.either_day = not fields[2].startswith('*') and not fields[4].startswith('*')
+
+    def matches(self, t):
+        day = t.day in self.day
+        weekday = t.isoweekday() % 7 in self.weekday
+        return (t.minute in self.minute and t.hour in self.hour and t.month in self.month
+                and ((day or weekday) if self.either_day else (day and weekday)))
+
+def read_crontab(path):
+    """[(job name, Schedule, command)], named after the script they run"""
+    entries = []
+    with open(path) as infile:
+        for line in infile:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split(None, 5)
+            command = fields[5].split('>>')[0].strip()
+            entries.append((os.path.basename(command.split()[0]), Schedule(fields[:5]), command))
+    return entries
+
+class Clock:
+    settles = False
+
+    def now(self):
+        return datetime.now()
+
+    async def sleep_until(self, when):
+        await asyncio.sleep(max(0, (when - datetime.now()).total_seconds()))
+
+class FakeClock:
+    """Jumps straight to whatever time is slept until. The scheduler lets
+    running jobs finish first, so a replay is deterministic."""
+    settles = True
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    async def sleep_until(self, when):
+        self.current = max(self.current, when)
+        await asyncio.sleep(0)
+
+def copy_newer(src, dst):
+    """shutil copy function that skips files dst has as new, like cp -u"""
+    try:
+        if os.stat(dst).st_mtime >= os.stat(src).st_mtime:
+            return dst
+    except FileNotFoundError:
+        pass
+    return shutil.copy2(src, dst)
+
+def publish(path, dest_env, purge_env):
+    """Copy an output to the directory in $dest_env and purge $purge_env,
+    as the crontab scripts do. Unset variables are skipped."""
+    dest = dest_env and os.environ.get(dest_env)
+    if dest:
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(path))
+        if os.path.isdir(path):
+            shutil.copytree(path, dest, copy_function=copy_newer, dirs_exist_ok=True)
+        else:
+            copy_newer(path, dest)
+    url = purge_env and os.environ.get(purge_env)
+    if url:
+        urllib.request.urlopen(urllib.request.Request(url, method='PURGE'))
+
+class Scheduler:
+    def __init__(self, clock, crontab=CRONTAB):
+        self.clock = clock
+        self.entries = read_crontab(crontab)
+        self.tasks = {}
+        self.again = set()
+        self.runs = dict.fromkeys((name for name, _, _ in self.entries), 0)
+
+        # warm state, each with the lock its users hold
+        self.garmin_lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        self.index = None
+        self.heart = HeartStore('.')
+        self.fragments = Fragments('stats')
+
+        # crontab script -> in-process job, returning the jobs to chain
+        self.native = {
+            'run_daily_dump.sh': lambda: self.dump(self.clock.now().date()),
+            'backfill_yesterday.sh': lambda: self.dump(self.clock.now().date() - timedelta(1)),
+            'plot_heart.sh': self.plot_heart,
+            'plot_tracks.sh': self.plot_tracks,
+            'generate_badge.sh': self.generate_badge,
+        }
+
+    def dump(self, day):
+        """daily.py [day]"""
+        with self.garmin_lock:
+            if daily.client is None:
+                daily.client = daily.connect()
+            try:
+                daily.dump_day(day.isoformat())
+                new = daily.dump_activities()
+            except daily.GarminConnectAuthenticationError:
+                # log in again on the next run
+                daily.client = None
+                raise
+            session.save_session(daily.client)
+        if new:
+            logging.info("%d new activities", len(new))
+            return ['plot_tracks.sh', 'generate_badge.sh']
+        return []
+
+    def plot_heart(self):
+        today = self.clock.now().date()
+        days = [(today - timedelta(1)).isoformat(), today.isoformat()]
+        with self.render_lock:
+            self.heart.update()
+            try:
+                drawn = heart_chart.render(self.heart, days, 'scripts/heart.png')
+            except Exception:
+                logging.exception("Drawing the heart chart failed, falling back to gnuplot")
+                with open('/tmp/heart.csv.part', 'w') as outfile:
+                    plot_heart.dump(self.heart, days, outfile)
+                os.replace('/tmp/heart.csv.part', '/tmp/heart.csv')
+                subprocess.run(['gnuplot', './heart.plot'], cwd='scripts', check=True)
+                drawn = True
+        if drawn:
+            publish('scripts/heart.png', 'HR_DEST_DIR', 'HR_CACHE_URL')
+        return []
+
+    def plot_tracks(self):
+        rendered = render_tracks.render_all('_activities', '_dashboard/dist/_activities-svg')
+        logging.info("Rendered %d tracks", len(rendered))
+        with self.render_lock:
+            if self.index is None:
+                self.index = ActivityIndex('_activities')
+            else:
+                self.index.refresh()
+            self.heart.update()
+            html = stats.render(self.index, self.heart, self.fragments)
+            pages = all_runs.render(self.index, '_dashboard/dist/runs', '_dashboard/dist')
+        write_if_changed('_dashboard/index.html', html + '\n')
+        for name, page in pages.items():
+            write_if_changed(os.path.join('_dashboard/dist/runs', name), page)
+        publish('_dashboard/dist', 'STATS_DEST_DIR', None)
+        publish('_dashboard/index.html', 'STATS_DEST_INDEX', None)
+        return []
+
+    def generate_badge(self):
+        if os.environ.get('BADGE_PATH'):
+            badge.write_badge(os.environ['BADGE_PATH'], badge.total_distance())
+        publish(None, None, 'BADGE_CACHE_URL')
+        return []
+
+    def command(self, name):
+        """The job for a crontab entry"""
+        if name in self.native:
+            return self.native[name]
+        command = next(command for entry, _, command in self.entries if entry == name)
+        def run():
+            subprocess.run(command, shell=True, check=True)
+            return []
+        return run
+
+    def trigger(self, name):
+        """Start a job, or queue one rerun if it is already running"""
+        task = self.tasks.get(name)
+        if task is not None and not task.done():
+            logging.info("%s is still running, will run again when it finishes", name)
+            self.again.add(name)
+            return task
+        self.tasks[name] = asyncio.create_task(self.run(name))
+        return self.tasks[name]
+
+    async def run(self, name):
+        while True:
+            self.again.discard(name)
+            started = time.monotonic()
+            logging.info("START: %s", name)
+            try:
+                with instrument.span('scheduler.job', job=name):
+                    chained = await asyncio.to_thread(self.command(name))
+            except Exception:
+                logging.exception("%s failed", name)
+                chained = []
+            # this process doesn't exit between jobs, write the counters now
+            instrument.flush()
+            self.runs[name] += 1
+            logging.info("END: %s (%.1fs)", name, time.monotonic() - started)
+            for job in chained:
+                self.trigger(job)
+            if name not in self.again:
+                break
+
+    async def idle(self):
+        """Wait until no job is running, including chained ones"""
+        while any(not task.done() for task in self.tasks.values()):
+            await asyncio.gather(*self.tasks.values())
+
+    async def loop(self, minutes=None):
+        for name, _, _ in self.entries:
+            await self.trigger(name)
+        await self.idle()
+
+        minute = self.clock.now().replace(second=0, microsecond=0)
+        ticks = 0
+        while minutes is None or ticks < minutes:
+            minute += timedelta(minutes=1)
+            ticks += 1
+            if self.clock.settles:
+                await self.idle()
+            await self.clock.sleep_until(minute)
+            for name, schedule, _ in self.entries:
+                if schedule.matches(minute):
+                    self.trigger(name)
+        await self.idle()
+
+def terminate(signum, frame):
+    # SIGTERM would end the process without running atexit handlers, and
+    # as PID 1 in the container it would be ignored. Exit like Ctrl-C so
+    # instrument's last counters are written.
+    sys.exit(128 + signum)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--crontab', default=CRONTAB,
+            help='schedule to run (default: crontab.txt next to this script)')
+    parser.add_argument('--fake-clock', metavar='START', type=datetime.fromisoformat,
+            help='replay the schedule from START offline, against fake_garmin')
+    parser.add_argument('--minutes', type=int,
+            help='stop after this many minutes of schedule')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.environ.get(daily.LOG_LEVEL_ENV, 'INFO').upper())
+    os.chdir(HERE)
+    if args.fake_clock:
+        os.environ['GARMIN_FAKE'] = '1'
+        clock = FakeClock(args.fake_clock)
+    else:
+        clock = Clock()
+
+    scheduler = Scheduler(clock, args.crontab)
+    signal.signal(signal.SIGTERM, terminate)
+    asyncio.run(scheduler.loop(args.minutes))
+    for name, runs in scheduler.runs.items():
+        print('%-24s %d runs' % (name, runs))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""Heart rate chart of yesterday and today, straight from the HR store.
+
+Draws what heart.plot draws without the CSV and gnuplot round trip: a
+red line over a dotted 2 bpm grid, both axes scaled to the data. Every
+pixel column keeps only the min, max, first and last reading that falls
+in it, so drawing costs the same however many samples there are.
+
+The PNG is encoded with zlib, the optional SVG is plain text. Both are
+skipped when the days' heart.dat files haven't changed since the last
+render, as recorded in OUTPUT.stamp.
+
+    ./heart_chart.py                          # heart.png
+    ./heart_chart.py -o heart.png --svg heart.svg
+"""
+
+from datetime import date, datetime, timedelta, timezone
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hrstore import HeartStore
+import storage
+
+WHITE = b'\xff\xff\xff'
+GRID = b'\xcc\xcc\xcc'
+RED = b'\xff\x00\x00'
+BLACK = b'\x00\x00\x00'
+
+# plot area inset from the image edges: left, top, right, bottom
+MARGINS = (80, 20, 20, 40)
+
+# 3x5 glyphs for the tick labels, title and axis label, drawn at FONT_SCALE
+FONT = {
+    '0': ('111', '101', '101', '101', '111'),
+    '1': ('010', '110', '010', '010', '111'),
+    '2': ('111', '001', '111', '100', '111'),
+    '3': ('111', '001', '111', '001', '111'),
+    '4': ('101', '101', '111', '001', '001'),
+    '5': ('111', '100', '111', '001', '111'),
+    '6': ('111', '100', '111', '101', '111'),
+    '7': ('111', '001', '001', '001', '001'),
+    '8': ('111', '101', '111', '101', '111'),
+    '9': ('111', '101', '111', '001', '111'),
+    'A': ('010', '101', '111', '101', '101'),
+    'B': ('110', '101', '110', '101', '110'),
+    'M': ('101', '111', '111', '101', '101'),
+    'P': ('110', '101', '110', '100', '100'),
+    'a': ('000', '011', '101', '101', '011'),
+    'd': ('001', '001', '011', '101', '011'),
+    'm': ('000', '110', '111', '101', '101'),
+}
+FONT_SCALE = 3
+
+def text_width(s):
+    return (len(s) * 4 - 1) * FONT_SCALE
+
+class Columns:
+    """Readings decimated to one (min, max, first, last) per pixel column.
+
+    joined[x] tells whether the first reading in column x continues the
+    line from the previous reading, which it doesn't after a missing one."""
+
+    def __init__(self, timestamps, rates, width):
+        self.width = width
+        self.low = [None] * width
+        self.high = [None] * width
+        self.first = [None] * width
+        self.last = [None] * width
+        self.joined = [False] * width
+
+        readings = [bpm for bpm in rates if bpm]
+        self.t0 = timestamps[0] if len(timestamps) else 0
+        self.t1 = timestamps[-1] if len(timestamps) else 1
+        self.b0 = min(readings) if readings else 0
+        self.b1 = max(readings) if readings else 1
+        if self.t1 == self.t0:
+            self.t1 += 1
+        if self.b1 == self.b0:
+            self.b1 += 1
+
+        previous = False
+        span = self.t1 - self.t0
+        for ts, bpm in zip(timestamps, rates):
+            if not bpm:
+                previous = False
+                continue
+            x = (ts - self.t0) * (width - 1) // span
+            if self.first[x] is None:
+                self.first[x] = self.low[x] = self.high[x] = bpm
+                self.joined[x] = previous
+            elif bpm < self.low[x]:
+                self.low[x] = bpm
+            elif bpm > self.high[x]:
+                self.high[x] = bpm
+            self.last[x] = bpm
+            previous = True
+
+    def segments(self):
+        """Vertical (x, bpm_from, bpm_to) strokes, in drawing order"""
+        previous = None
+        for x in range(self.width):
+            if self.first[x] is None:
+                continue
+            if self.joined[x] and previous is not None:
+                px = previous
+                for step in range(1, x - px + 1):
+                    # straight line from the previous column's last reading
+                    a = self.last[px] + (self.first[x] - self.last[px]) * (step - 1) / (x - px)
+                    b = self.last[px] + (self.first[x] - self.last[px]) * step / (x - px)
+                    yield px + step, a, b
+            yield x, self.low[x], self.high[x]
+            previous = x
+
+class Canvas:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(WHITE * (width * height))
+
+    def set(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = (y * self.width + x) * 3
+            self.pixels[i:i + 3] = color
+
+    def vline(self, x, y0, y1, color):
+        for y in range(min(y0, y1), max(y0, y1) + 1):
+            self.set(x, y, color)
+
+    def dotted_hline(self, x0, x1, y, color):
+        for x in range(x0, x1 + 1, 3):
+            self.set(x, y, color)
+
+    def text(self, x, y, s, color):
+        for ch in s:
+            for row, bits in enumerate(FONT.get(ch, ())):
+                for col, bit in enumerate(bits):
+                    if bit == '1':
+                        for dy in range(FONT_SCALE):
+                            for dx in range(FONT_SCALE):
+                                self.set(x + col * FONT_SCALE + dx, y + row * FONT_SCALE + dy, color)
+            x += 4 * FONT_SCALE
+
+    def vtext(self, x, y, s, color):
+        """Text turned a quarter left, reading upwards from y"""
+        for ch in s:
+            for row, bits in enumerate(FONT.get(ch, ())):
+                for col, bit in enumerate(bits):
+                    if bit == '1':
+                        for dy in range(FONT_SCALE):
+                            for dx in range(FONT_SCALE):
+                                self.set(x + row * FONT_SCALE + dx, y - col * FONT_SCALE - dy, color)
+            y -= 4 * FONT_SCALE
+
+    def png(self):
+        stride = self.width * 3
+        raw = b''.join(b'\x00' + self.pixels[y * stride:(y + 1) * stride]
+                       for y in range(self.height))
+
+        def chunk(kind, data):
+            return (struct.pack('>I', len(data)) + kind + data
+                    + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(raw, 6))
+                + chunk(b'IEND', b''))
+
+class Chart:
+    """Maps readings onto the plot area of a width x height image"""
+
+    def __init__(self, timestamps, rates, width, height):
+        left, top, right, bottom = MARGINS
+        self.width, self.height = width, height
+        self.x0, self.y0 = left, top
+        self.plot_width = width - left - right
+        self.plot_height = height - top - bottom
+        self.columns = Columns(timestamps, rates, self.plot_width)
+
+    def y(self, bpm):
+        c = self.columns
+        return self.y0 + round((c.b1 - bpm) * (self.plot_height - 1) / (c.b1 - c.b0))
+
+    def y_ticks(self):
+        """Every 2 bpm like heart.plot's ytics, and the labelled subset"""
+        c = self.columns
+        ticks = list(range(c.b0 + c.b0 % 2, c.b1 + 1, 2))
+        label_step = 2
+        while label_step * self.plot_height / (c.b1 - c.b0) < 20:
+            label_step *= 5
+        return ticks, [tick for tick in ticks if tick % label_step == 0]
+
+    def x_ticks(self):
+        """(x, 'DDHH') every 4 hours on the hour, UTC like gnuplot's %s"""
+        c = self.columns
+        ts = c.t0 - c.t0 % 14400 + (14400 if c.t0 % 14400 else 0)
+        while ts <= c.t1:
+            x = self.x0 + (ts - c.t0) * (self.plot_width - 1) // (c.t1 - c.t0)
+            yield x, datetime.fromtimestamp(ts, timezone.utc).strftime('%d%H')
+            ts += 14400
+
+    def png(self):
+        canvas = Canvas(self.width, self.height)
+        canvas.text(self.width // 2 - text_width('Adam') // 2, 2, 'Adam', BLACK)
+        canvas.vtext(4, self.y0 + self.plot_height // 2 + text_width('BPM') // 2, 'BPM', BLACK)
+        grid, labels = self.y_ticks()
+        for bpm in grid:
+            canvas.dotted_hline(self.x0, self.x0 + self.plot_width - 1, self.y(bpm), GRID)
+        for bpm in labels:
+            label = str(bpm)
+            canvas.text(self.x0 - 8 - len(label) * 4 * FONT_SCALE, self.y(bpm) - 7, label, BLACK)
+        for x, label in self.x_ticks():
+            canvas.vline(x, self.y0 + self.plot_height, self.y0 + self.plot_height + 5, BLACK)
+            canvas.text(x - len(label) * 2 * FONT_SCALE, self.y0 + self.plot_height + 10, label, BLACK)
+        for x, a, b in self.columns.segments():
+            canvas.vline(self.x0 + x, self.y(a), self.y(b), RED)
+        return canvas.png()
+
+    def svg(self):
+        grid, labels = self.y_ticks()
+        right = self.x0 + self.plot_width - 1
+        bottom = self.y0 + self.plot_height
+        lines = ['<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 %d %d">'
+                 % (self.width, self.height),
+                 '<rect width="100%" height="100%" fill="#ffffff"/>',
+                 '<text x="%d" y="14" text-anchor="middle" font-size="14">Adam</text>'
+                 % (self.width // 2),
+                 '<text x="16" y="%d" text-anchor="middle" font-size="14" '
+                 'transform="rotate(-90 16 %d)">BPM</text>'
+                 % ((self.y0 + self.plot_height // 2,) * 2)]
+        for bpm in grid:
+            lines.append('<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="#cccccc" '
+                         'stroke-dasharray="1,2"/>' % (self.x0, self.y(bpm), right, self.y(bpm)))
+        for bpm in labels:
+            lines.append('<text x="%d" y="%d" text-anchor="end" font-size="12">%d</text>'
+                         % (self.x0 - 8, self.y(bpm) + 4, bpm))
+        for x, label in self.x_ticks():
+            lines.append('<text x="%d" y="%d" text-anchor="middle" font-size="12">%s</text>'
+                         % (x, bottom + 20, label))
+        path = []
+        for x, a, b in self.columns.segments():
+            path.append('M%d %dV%d' % (self.x0 + x, self.y(a), self.y(b)))
+        lines.append('<path fill="none" stroke="#ff0000" stroke-width="1" d="%s"/>'
+                     % ''.join(path))
+        lines.append('</svg>')
+        return '\n'.join(lines) + '\n'
+
+def render(store, days, output, svg=None, width=1920, height=1080):
+    """Draw the given days' heart rate into output (PNG) and svg, unless
+    nothing changed since the last time. Returns True if it drew."""
+    stamp_path = output + '.stamp'
+    stamp = {'days': {day: store.index.get(day) for day in days},
+             'size': [width, height], 'svg': svg}
+    try:
+        with open(stamp_path) as infile:
+            if json.load(infile) == stamp and os.path.exists(output):
+                return False
+    except (OSError, ValueError):
+        pass
+
+    timestamps, rates = [], []
+    for day in days:
+        day_ts, day_bpm = store.day(day)
+        timestamps.extend(day_ts)
+        rates.extend(day_bpm)
+
+    chart = Chart(timestamps, rates, width, height)
+    storage.write_atomic(output, chart.png())
+    if svg:
+        storage.write_atomic(svg, chart.svg().encode())
+    storage.write_atomic(stamp_path, json.dumps(stamp, sort_keys=True).encode())
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', metavar='PNG', default='heart.png',
+            help='PNG to write (default: heart.png)')
+    parser.add_argument('--svg', metavar='SVG',
+            help='also write an SVG version')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    store = HeartStore('..')
+    store.update()
+    today = date.today()
+    days = [(today - timedelta(1)).isoformat(), today.isoformat()]
+    if not render(store, days, args.o, args.svg, args.width, args.height):
+        print('%s is up to date' % args.o)
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,31 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import json
 import csv
 
 from datetime import date, timedelta
 
-yesterday = (date.today() - timedelta(1)).isoformat()
-today = date.today().isoformat()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-spamwriter = csv.writer(sys.stdout)
+from hrstore import HeartStore
 
-def dump(ts):
-    with open("../%s/heart.dat" % ts) as json_file:
-        data = json.load(json_file)
-        for row in data['heartRateValues']:
-            ts = row[0] // 1000
-            bpm = row[1]
-            spamwriter.writerow([ts, bpm])
+def dump(store, days, outfile):
+    """Write [timestamp, bpm] rows of the given days' heart.dat as CSV"""
+    spamwriter = csv.writer(outfile)
+    for day in days:
+        timestamps, rates = store.day(day)
+        for ts, bpm in zip(timestamps, rates):
+            spamwriter.writerow([ts, bpm or None])
 
-dump(yesterday)
-dump(today)
+def main():
+    store = HeartStore('..')
+    store.update()
+
+    yesterday = (date.today() - timedelta(1)).isoformat()
+    today = date.today().isoformat()
+    dump(store, [yesterday, today], sys.stdout)
+
+if __name__ == '__main__':
+    main()
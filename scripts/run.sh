@@ -1,4 +1,7 @@
 #!/usr/bin/env bash
 
-./plot_heart.py > /tmp/heart.csv
-gnuplot ./heart.plot
+# draw in-process, fall back to CSV + gnuplot if that fails
+if ! ./heart_chart.py -o heart.png; then
+    ./plot_heart.py > /tmp/heart.csv
+    gnuplot ./heart.plot
+fi
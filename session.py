@@ -0,0 +1,64 @@
+"""File-backed Garmin Connect session shared by every job.
+
+The serialised garth tokens are kept in SESSION_FILE. Logging in with
+them skips the credential exchange; garth refreshes the OAuth2 token on
+its own once it expires and the refreshed tokens are written back. An
+exclusive lock on SESSION_FILE.lock makes overlapping cron jobs wait for
+each other instead of both doing a full login.
+"""
+
+from contextlib import contextmanager
+
+import fcntl
+import logging
+
+import storage
+
+SESSION_FILE = '.garmin_session'
+
+@contextmanager
+def locked(path):
+    with open(path, 'a') as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+def read_session(path):
+    try:
+        with open(path) as infile:
+            return infile.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def write_session(path, token):
+    storage.write_atomic(path, token.encode(), 0o600)
+
+def save_session(client, path=SESSION_FILE):
+    """Persist the client's tokens if they changed, e.g. after a refresh"""
+    token = client.garth.dumps()
+    with locked(path + '.lock'):
+        if token != read_session(path):
+            write_session(path, token)
+
+def get_client(email, password, path=SESSION_FILE, factory=None):
+    """Return a logged in client, reusing the cached session when valid"""
+    if factory is None:
+        from garminconnect import Garmin as factory
+
+    with locked(path + '.lock'):
+        client = factory(email, password)
+        token = read_session(path)
+        if token:
+            try:
+                client.login(token)
+                if client.garth.dumps() != token:
+                    write_session(path, client.garth.dumps())
+                return client
+            except Exception as error:
+                logging.info("Cached session rejected (%s), logging in", error)
+
+        client.login()
+        write_session(path, client.garth.dumps())
+        return client
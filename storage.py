@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Where daily.py keeps raw dumps, and how the rest of the tree reads them.
+
+Two layouts of a YYYY-MM-DD day directory:
+
+    files    stats.dat, steps.dat, heart.dat, sleep.dat as indented JSON
+    bundle   one day.ndjson.gz, a gzip of one compact JSON line per kind:
+             {"kind": "heart", "data": {...}}
+
+daily.py writes bundles when ME_STORAGE=bundle and .dat files otherwise.
+Readers (process.py, hrstore.py and through it stats.py and the heart
+plots) go through read_day()/read_kind() and take whichever is there,
+the bundle first.
+
+In bundle mode daily.py also only downloads the ORIGINAL zip of each
+activity. The GPX the track renderer needs is derived from the FIT file
+inside it on demand, see derive_gpx().
+
+    ./storage.py pack [DAY_DIR...]     # .dat files -> bundles
+    ./storage.py unpack [DAY_DIR...]   # bundles -> .dat files
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import struct
+import sys
+import zipfile
+import zlib
+
+import fit
+
+STORAGE_ENV = 'ME_STORAGE'
+KINDS = ('stats', 'steps', 'heart', 'sleep')
+BUNDLE = 'day.ndjson.gz'
+DAY_DIRS = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+
+def bundled():
+    """True when daily.py should write bundles"""
+    return os.environ.get(STORAGE_ENV) == 'bundle'
+
+def write_atomic(path, data, mode=0o666):
+    """Write bytes to path through path.part, so readers never see half a
+    file. mode (before the umask) only applies when the file is created."""
+    fd = os.open(path + '.part', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, 'wb') as outfile:
+        outfile.write(data)
+    os.replace(path + '.part', path)
+
+def day_paths(day_dir):
+    """The files holding a day's data, for change detection"""
+    bundle = os.path.join(day_dir, BUNDLE)
+    if os.path.exists(bundle):
+        return [bundle]
+    return sorted(glob.glob(os.path.join(day_dir, '*.dat')))
+
+def kind_path(day_dir, kind):
+    """The file holding one kind of a day's data, or None"""
+    for path in (os.path.join(day_dir, BUNDLE), os.path.join(day_dir, '%s.dat' % kind)):
+        if os.path.exists(path):
+            return path
+    return None
+
+def read_bundle(path):
+    with gzip.open(path, 'rt') as infile:
+        return {entry['kind']: entry['data'] for entry in map(json.loads, infile)}
+
+def read_day(day_dir):
+    """{kind: parsed data} for every kind the day has"""
+    bundle = os.path.join(day_dir, BUNDLE)
+    if os.path.exists(bundle):
+        return read_bundle(bundle)
+    day = {}
+    for path in glob.glob(os.path.join(day_dir, '*.dat')):
+        with open(path) as infile:
+            day[os.path.splitext(os.path.basename(path))[0]] = json.load(infile)
+    return day
+
+def read_kind(day_dir, kind):
+    """One kind of a day's data, None if missing"""
+    path = kind_path(day_dir, kind)
+    if path is None:
+        return None
+    if path.endswith(BUNDLE):
+        return read_bundle(path).get(kind)
+    with open(path) as infile:
+        return json.load(infile)
+
+def write_bundle(day_dir, day):
+    lines = ''.join(json.dumps({'kind': kind, 'data': data}, sort_keys=True,
+                               separators=(',', ':')) + '\n'
+                    for kind, data in sorted(day.items()))
+    # mtime=0 keeps the bytes the same for the same data
+    write_atomic(os.path.join(day_dir, BUNDLE), gzip.compress(lines.encode(), 6, mtime=0))
+
+def write_day(day_dir, day):
+    """Store {kind: data} in the layout ME_STORAGE asks for"""
+    os.makedirs(day_dir, exist_ok=True)
+    if bundled():
+        write_bundle(day_dir, day)
+        for kind in day:
+            if os.path.exists(os.path.join(day_dir, '%s.dat' % kind)):
+                os.remove(os.path.join(day_dir, '%s.dat' % kind))
+        return
+    for kind, data in day.items():
+        path = os.path.join(day_dir, '%s.dat' % kind)
+        write_atomic(path, json.dumps(data, sort_keys=True, indent=4).encode())
+
+def pack(day_dir):
+    day = read_day(day_dir)
+    if not day or os.path.exists(os.path.join(day_dir, BUNDLE)):
+        return False
+    write_bundle(day_dir, day)
+    for path in glob.glob(os.path.join(day_dir, '*.dat')):
+        os.remove(path)
+    return True
+
+def unpack(day_dir):
+    bundle = os.path.join(day_dir, BUNDLE)
+    if not os.path.exists(bundle):
+        return False
+    for kind, data in read_bundle(bundle).items():
+        write_atomic(os.path.join(day_dir, '%s.dat' % kind),
+                     json.dumps(data, sort_keys=True, indent=4).encode())
+    os.remove(bundle)
+    return True
+
+def derive_gpx(directory):
+    """Write activity_<id>.gpx from activity_<id>.zip where there is no
+    GPX, or in bundle mode where the zip is newer than the GPX. Outside
+    bundle mode an existing GPX was downloaded from Garmin and is left
+    alone: it is often older than the zip only because they downloaded
+    in parallel. Activities without a position get a GPX with an empty
+    track, so they aren't retried. Returns the GPX files written."""
+    written = []
+    for archive in glob.glob(os.path.join(directory, 'activity_*.zip')):
+        gpx = archive[:-len('.zip')] + '.gpx'
+        if os.path.exists(gpx) and (not bundled() or
+                                    os.stat(gpx).st_mtime >= os.stat(archive).st_mtime):
+            continue
+        try:
+            with open(archive, 'rb') as infile:
+                records = list(fit.read_records(fit.read_zip(infile.read())))
+        except (fit.FitError, ValueError, IndexError, struct.error,
+                zipfile.BadZipFile, zlib.error) as e:
+            logging.warning("Can't read a track from %s: %s", archive, e)
+            continue
+        write_atomic(gpx, fit.to_gpx(records).encode())
+        written.append(gpx)
+    return written
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('pack', 'unpack'):
+        sys.exit(__doc__.split('\n\n')[-1])
+    convert = pack if sys.argv[1] == 'pack' else unpack
+    for day_dir in sys.argv[2:] or sorted(glob.glob(DAY_DIRS)):
+        if convert(day_dir):
+            print(day_dir)
+
+if __name__ == '__main__':
+    main()